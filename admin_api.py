@@ -1,32 +1,85 @@
+import csv
+import io
+import logging
 import os
+import time
 from enum import Enum
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
-from database import get_session
-from models import Route, User
+from database import get_db_session, get_engine
+from models import Route, User, UserQuizResult
+from routeevents import notify_routes_changed
+from routeimport import import_routes, DEFAULT_BATCH_SIZE
+from pagination import InvalidCursor, apply_keyset, split_page
+from statsstore import read_statistics, record_counter
+from usercontextmiddleware import invalidate_user_context
+from localcache import LocalTTLCache, InvalidationListener
+from core.redis import redis_client
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
+EXPORT_CHUNK_ROWS = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PRINCIPAL_CACHE_TTL = 300  # seconds, further capped by the token's exp
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_INVALIDATION_CHANNEL = "cache:invalidate:principal"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+logger = logging.getLogger(__name__)
+
+class RouteSortEnum(str, Enum):
+    id = "id"
+    name = "name"
+    created_at = "created_at"
+    updated_at = "updated_at"
 
 class UserRoleEnum(str, Enum):
     admin = "admin"
     user = "user"
     moderator = "moderator"
 
+class Principal:
+    """The subset of a User that authorization needs; cached per user id."""
+
+    __slots__ = ("id", "role", "is_active")
+
+    def __init__(self, id: int, role: str, is_active: bool = True):
+        self.id = id
+        self.role = role
+        self.is_active = is_active
+
+_principals = LocalTTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+def _invalidate_principal(payload: str) -> None:
+    try:
+        _principals.delete(int(payload))
+    except (TypeError, ValueError):
+        logger.warning("Ignoring malformed principal invalidation message: %r", payload)
+
+principal_invalidation_listener = InvalidationListener(
+    redis_client, PRINCIPAL_INVALIDATION_CHANNEL, _invalidate_principal
+)
+
+async def invalidate_principal(user_id: int) -> None:
+    _principals.delete(user_id)
+    try:
+        await redis_client.publish(PRINCIPAL_INVALIDATION_CHANNEL, str(user_id))
+    except Exception as e:
+        logger.warning("Failed to broadcast principal invalidation for user %s: %s", user_id, e)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_session)
-):
+    session: AsyncSession = Depends(get_db_session)
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -40,14 +93,26 @@ async def get_current_user(
         user_id = int(sub)
     except (JWTError, TypeError, ValueError):
         raise credentials_exception
-    result = await session.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
-    if user is None:
+    principal_invalidation_listener.start()
+    principal = _principals.get(user_id)
+    if principal is None:
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal(user.id, user.role, getattr(user, "is_active", True))
+        ttl = PRINCIPAL_CACHE_TTL
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            ttl = min(ttl, exp - time.time())
+        if ttl > 0:
+            _principals.set(user_id, principal, ttl=ttl)
+    if not principal.is_active:
         raise credentials_exception
-    return user
+    return principal
 
 async def get_current_admin_user(
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != UserRoleEnum.admin.value:
         raise HTTPException(
@@ -81,7 +146,7 @@ class RouteOut(RouteBase):
 
 class UserOut(BaseModel):
     id: int
-    username: str
+    username: Optional[str]
     role: str
     created_at: datetime
     updated_at: datetime
@@ -89,31 +154,85 @@ class UserOut(BaseModel):
     class Config:
         orm_mode = True
 
+class QuizResultOut(BaseModel):
+    id: int
+    user_id: int
+    quiz_id: int
+    score: int
+    completed_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class ExportFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
 class UserRoleUpdate(BaseModel):
     role: UserRoleEnum
 
+class ImportErrorOut(BaseModel):
+    line: int
+    error: str
+
+class ImportReportOut(BaseModel):
+    rows_read: int
+    rows_imported: int
+    routes_upserted: int
+    routes_created: int
+    points_loaded: int
+    errors: List[ImportErrorOut]
+
 class StatsOut(BaseModel):
     total_routes: int
     total_users: int
+    active_premium: Optional[int] = None
+    quiz_completions: Optional[int] = None
+    badges_awarded: Optional[int] = None
+    daily_active_users: Optional[int] = None
 
 router = APIRouter(dependencies=[Depends(get_current_admin_user)])
 
 @router.get("/routes", response_model=List[RouteOut])
 async def get_routes(
+    response: Response,
     page: int = Query(1, gt=0),
     size: int = Query(10, gt=0, le=100),
-    session: AsyncSession = Depends(get_session)
+    cursor: Optional[str] = Query(None, description="Continuation token from the X-Next-Cursor header"),
+    sort: RouteSortEnum = Query(RouteSortEnum.id),
+    session: AsyncSession = Depends(get_db_session)
 ):
-    offset = (page - 1) * size
-    result = await session.execute(
-        select(Route).order_by(Route.id).offset(offset).limit(size)
-    )
-    return result.scalars().all()
+    try:
+        stmt = apply_keyset(select(Route), getattr(Route, sort.value), Route.id, cursor, sort.value, size)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not cursor:
+        stmt = stmt.offset((page - 1) * size)
+    result = await session.execute(stmt)
+    routes, next_cursor = split_page(result.scalars().all(), size, sort.value, sort.value)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return routes
+
+@router.post("/routes/import", response_model=ImportReportOut)
+async def import_routes_csv(
+    file: UploadFile = File(...),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, gt=0, le=10000),
+):
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    async with get_engine().connect() as conn:
+        raw = await conn.get_raw_connection()
+        report = await import_routes(raw.driver_connection, stream, batch_size)
+    if report.routes_created:
+        await record_counter("routes", report.routes_created)
+    if report.rows_imported:
+        await notify_routes_changed()
+    return report.as_dict()
 
 @router.get("/routes/{route_id}", response_model=RouteOut)
 async def get_route(
     route_id: int,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     result = await session.execute(select(Route).where(Route.id == route_id))
     route = result.scalars().first()
@@ -124,23 +243,25 @@ async def get_route(
 @router.post("/routes", status_code=status.HTTP_201_CREATED, response_model=RouteOut)
 async def create_route(
     route: RouteCreate,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     new_route = Route(**route.dict())
     try:
         session.add(new_route)
         await session.commit()
         await session.refresh(new_route)
-        return new_route
     except Exception:
         await session.rollback()
         raise
+    await notify_routes_changed()
+    await record_counter("routes", 1)
+    return new_route
 
 @router.put("/routes/{route_id}", response_model=RouteOut)
 async def update_route(
     route_id: int,
     route_update: RouteUpdate,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     result = await session.execute(select(Route).where(Route.id == route_id))
     route = result.scalars().first()
@@ -153,15 +274,16 @@ async def update_route(
         session.add(route)
         await session.commit()
         await session.refresh(route)
-        return route
     except Exception:
         await session.rollback()
         raise
+    await notify_routes_changed()
+    return route
 
 @router.delete("/routes/{route_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_route(
     route_id: int,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     result = await session.execute(select(Route).where(Route.id == route_id))
     route = result.scalars().first()
@@ -170,23 +292,92 @@ async def delete_route(
     try:
         session.delete(route)
         await session.commit()
-        return Response(status_code=status.HTTP_204_NO_CONTENT)
     except Exception:
         await session.rollback()
         raise
+    await notify_routes_changed()
+    await record_counter("routes", -1)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/users", response_model=List[UserOut])
 async def get_users(
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     result = await session.execute(select(User))
     return result.scalars().all()
 
+def _export_response(session: AsyncSession, stmt, schema, fmt: ExportFormatEnum, name: str) -> StreamingResponse:
+    fields = list(schema.__fields__)
+
+    async def generate():
+        try:
+            result = await session.stream_scalars(stmt.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            if fmt == ExportFormatEnum.csv:
+                yield ",".join(fields) + "\r\n"
+            async for partition in result.partitions():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer) if fmt == ExportFormatEnum.csv else None
+                for obj in partition:
+                    # Headers are already sent, so a row that does not fit the
+                    # schema is skipped and logged rather than ending the stream.
+                    try:
+                        item = schema.from_orm(obj)
+                    except ValidationError as e:
+                        logger.error("Skipping %s row %s in %s export: %s", schema.__name__,
+                                     getattr(obj, "id", None), name, e)
+                        continue
+                    if writer is not None:
+                        writer.writerow([_csv_value(getattr(item, field)) for field in fields])
+                    else:
+                        buffer.write(item.json())
+                        buffer.write("\n")
+                # Drop the chunk's ORM instances so memory stays flat across the stream.
+                session.expunge_all()
+                yield buffer.getvalue()
+        finally:
+            await session.close()
+
+    media_type = "text/csv" if fmt == ExportFormatEnum.csv else "application/x-ndjson"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt.value}"'},
+    )
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+@router.get("/export/users")
+async def export_users(
+    format: ExportFormatEnum = Query(ExportFormatEnum.ndjson),
+    session: AsyncSession = Depends(get_db_session)
+):
+    return _export_response(session, select(User).order_by(User.id), UserOut, format, "users")
+
+@router.get("/export/routes")
+async def export_routes(
+    format: ExportFormatEnum = Query(ExportFormatEnum.ndjson),
+    session: AsyncSession = Depends(get_db_session)
+):
+    return _export_response(session, select(Route).order_by(Route.id), RouteOut, format, "routes")
+
+@router.get("/export/quiz-results")
+async def export_quiz_results(
+    format: ExportFormatEnum = Query(ExportFormatEnum.ndjson),
+    session: AsyncSession = Depends(get_db_session)
+):
+    stmt = select(UserQuizResult).order_by(UserQuizResult.id)
+    return _export_response(session, stmt, QuizResultOut, format, "quiz_results")
+
 @router.put("/users/{user_id}/role", response_model=UserOut)
 async def update_user_role(
     user_id: int,
     role_update: UserRoleUpdate,
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
     result = await session.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
@@ -197,15 +388,28 @@ async def update_user_role(
         session.add(user)
         await session.commit()
         await session.refresh(user)
-        return user
     except Exception:
         await session.rollback()
         raise
+    await invalidate_principal(user.id)
+    await invalidate_user_context(user.telegram_id, redis_client)
+    return user
 
 @router.get("/statistics", response_model=StatsOut)
 async def get_statistics(
-    session: AsyncSession = Depends(get_session)
+    session: AsyncSession = Depends(get_db_session)
 ):
+    stats = await read_statistics()
+    if stats is not None:
+        return StatsOut(
+            total_routes=stats["routes"],
+            total_users=stats["users"],
+            active_premium=stats["premium_active"],
+            quiz_completions=stats["quiz_completions"],
+            badges_awarded=stats["badges_awarded"],
+            daily_active_users=stats["daily_active_users"],
+        )
+    # Counters unavailable or not yet reconciled: count directly.
     result_routes = await session.execute(select(func.count()).select_from(Route))
     total_routes = result_routes.scalar_one()
     result_users = await session.execute(select(func.count()).select_from(User))
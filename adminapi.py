@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from pydantic import BaseModel, Field, root_validator
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List
+from typing import List, Optional
 
-from database import get_db
+from database import get_db_session
 from models import Route
 from schemas import AdminRouteCreate, AdminRouteUpdate, AdminRouteOut
-from admin_api import get_current_admin_user
+from admin_api import get_current_admin_user, RouteSortEnum, NEXT_CURSOR_HEADER
+from pagination import InvalidCursor, apply_keyset, split_page
+from routeevents import notify_routes_changed
+from statsstore import record_counter
+
+MAX_BULK_ITEMS = 1000
 
 router = APIRouter(
     prefix="/admin/routes",
@@ -14,39 +21,169 @@ router = APIRouter(
     dependencies=[Depends(get_current_admin_user)]
 )
 
+class AdminRoutePatch(AdminRouteUpdate):
+    id: int
+
+class AdminRouteBulkRequest(BaseModel):
+    create: List[AdminRouteCreate] = Field(default_factory=list)
+    update: List[AdminRoutePatch] = Field(default_factory=list)
+    delete: List[int] = Field(default_factory=list)
+
+    @root_validator
+    def check_batch_size(cls, values):
+        total = sum(len(values.get(op) or []) for op in ("create", "update", "delete"))
+        if total == 0:
+            raise ValueError("Bulk request must contain at least one operation")
+        if total > MAX_BULK_ITEMS:
+            raise ValueError(f"Bulk request is limited to {MAX_BULK_ITEMS} operations")
+        return values
+
+class AdminBulkItemResult(BaseModel):
+    op: str
+    index: int
+    id: Optional[int] = None
+    status: str
+    route: Optional[AdminRouteOut] = None
+
+class AdminRouteBulkResponse(BaseModel):
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    not_found: int = 0
+    results: List[AdminBulkItemResult] = Field(default_factory=list)
+
+def _database_error(e: SQLAlchemyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Database error: {e}"
+    )
+
 @router.get("/", response_model=List[AdminRouteOut])
-def get_admin_routes(
+async def get_admin_routes(
+    response: Response,
     limit: int = Query(100, gt=0, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None),
+    sort: RouteSortEnum = Query(RouteSortEnum.id),
+    session: AsyncSession = Depends(get_db_session)
 ):
-    return db.query(Route).limit(limit).offset(offset).all()
+    try:
+        stmt = apply_keyset(select(Route), getattr(Route, sort.value), Route.id, cursor, sort.value, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not cursor:
+        stmt = stmt.offset(offset)
+    result = await session.execute(stmt)
+    routes, next_cursor = split_page(result.scalars().all(), limit, sort.value, sort.value)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return routes
 
 @router.post("/", response_model=AdminRouteOut, status_code=status.HTTP_201_CREATED)
-def create_admin_route(
+async def create_admin_route(
     route_in: AdminRouteCreate,
-    db: Session = Depends(get_db)
+    session: AsyncSession = Depends(get_db_session)
 ):
     route = Route(**route_in.dict())
-    db.add(route)
+    session.add(route)
     try:
-        db.commit()
-        db.refresh(route)
+        await session.commit()
+        await session.refresh(route)
     except SQLAlchemyError as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
+        await session.rollback()
+        raise _database_error(e)
+    await notify_routes_changed()
+    await record_counter("routes", 1)
     return route
 
+@router.post("/bulk", response_model=AdminRouteBulkResponse)
+async def bulk_admin_routes(
+    bulk_in: AdminRouteBulkRequest,
+    session: AsyncSession = Depends(get_db_session)
+):
+    """
+    Apply creates, patches and deletes in a single transaction and report
+    the outcome per item. Patches and deletes for unknown ids are reported
+    as not_found and patches carrying only an id as unchanged; neither
+    fails the batch. A database error rolls back the whole batch.
+    """
+    response = AdminRouteBulkResponse()
+    try:
+        if bulk_in.create:
+            created = await session.scalars(
+                insert(Route).returning(Route, sort_by_parameter_order=True),
+                [item.dict() for item in bulk_in.create],
+            )
+            for index, route in enumerate(created.all()):
+                response.results.append(AdminBulkItemResult(
+                    op="create", index=index, id=route.id, status="created",
+                    route=AdminRouteOut.from_orm(route),
+                ))
+                response.created += 1
+
+        if bulk_in.update:
+            patch_ids = {patch.id for patch in bulk_in.update}
+            existing = set((await session.scalars(select(Route.id).where(Route.id.in_(patch_ids)))).all())
+            rows = [
+                patch.dict(exclude_unset=True)
+                for patch in bulk_in.update
+                if patch.id in existing and len(patch.dict(exclude_unset=True)) > 1
+            ]
+            if rows:
+                await session.execute(update(Route), rows)
+            updated = await session.scalars(
+                select(Route).where(Route.id.in_(existing)).execution_options(populate_existing=True)
+            )
+            updated_by_id = {route.id: route for route in updated.all()}
+            for index, patch in enumerate(bulk_in.update):
+                route = updated_by_id.get(patch.id)
+                if route is None:
+                    response.results.append(AdminBulkItemResult(op="update", index=index, id=patch.id, status="not_found"))
+                    response.not_found += 1
+                    continue
+                # A patch carrying only its id changes nothing.
+                changed = len(patch.dict(exclude_unset=True)) > 1
+                response.results.append(AdminBulkItemResult(
+                    op="update", index=index, id=patch.id, status="updated" if changed else "unchanged",
+                    route=AdminRouteOut.from_orm(route),
+                ))
+                if changed:
+                    response.updated += 1
+                else:
+                    response.unchanged += 1
+
+        if bulk_in.delete:
+            deleted = set((await session.scalars(
+                delete(Route).where(Route.id.in_(set(bulk_in.delete))).returning(Route.id)
+            )).all())
+            for index, route_id in enumerate(bulk_in.delete):
+                found = route_id in deleted
+                response.results.append(AdminBulkItemResult(
+                    op="delete", index=index, id=route_id, status="deleted" if found else "not_found",
+                ))
+                if found:
+                    response.deleted += 1
+                else:
+                    response.not_found += 1
+
+        await session.commit()
+    except SQLAlchemyError as e:
+        await session.rollback()
+        raise _database_error(e)
+    if response.created or response.updated or response.deleted:
+        await notify_routes_changed()
+    if response.created != response.deleted:
+        await record_counter("routes", response.created - response.deleted)
+    return response
+
 @router.patch("/{route_id}", response_model=AdminRouteOut)
-def update_admin_route(
+async def update_admin_route(
     route_id: int,
     route_in: AdminRouteUpdate,
-    db: Session = Depends(get_db)
+    session: AsyncSession = Depends(get_db_session)
 ):
-    route = db.get(Route, route_id)
+    route = await session.get(Route, route_id)
     if not route:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -58,33 +195,30 @@ def update_admin_route(
         if field in data:
             setattr(route, field, data[field])
     try:
-        db.commit()
-        db.refresh(route)
+        await session.commit()
+        await session.refresh(route)
     except SQLAlchemyError as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
+        await session.rollback()
+        raise _database_error(e)
+    await notify_routes_changed()
     return route
 
 @router.delete("/{route_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_admin_route(
+async def delete_admin_route(
     route_id: int,
-    db: Session = Depends(get_db)
+    session: AsyncSession = Depends(get_db_session)
 ):
-    route = db.get(Route, route_id)
+    route = await session.get(Route, route_id)
     if not route:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Route not found"
         )
     try:
-        db.delete(route)
-        db.commit()
+        await session.delete(route)
+        await session.commit()
     except SQLAlchemyError as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Database error: {e}"
-        )
\ No newline at end of file
+        await session.rollback()
+        raise _database_error(e)
+    await notify_routes_changed()
+    await record_counter("routes", -1)
@@ -4,7 +4,6 @@ import logging
 import asyncio
 from typing import List
 from pydantic import BaseSettings
-import asyncpg
 import aioredis
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand, BotCommandScopeDefault, ParseMode
@@ -13,6 +12,14 @@ from handlers.route import register_route_handlers
 from handlers.quiz import register_quiz_handlers
 from handlers.gamification import register_gamification_handlers
 from handlers.geolocation import register_geolocation_handlers
+from prometheus_client import start_http_server
+from database import RawConnectionPool, async_database_url, dispose_db, get_engine, init_db, load_pool_options
+from metrics import instrument_bot, instrument_dispatcher, instrument_redis
+from querydiagnostics import QueryScopeMiddleware
+from usercontextmiddleware import UserContextLoaderMiddleware
+from statsstore import ActiveUserTracker
+from outboundscheduler import OutboundScheduler, DEFAULT_CONCURRENCY, DEFAULT_GLOBAL_RATE, DEFAULT_PER_CHAT_RATE
+from updatestreams import UpdateStreamPublisher, UpdateStreamWorker, shards_for_worker, DEFAULT_SHARDS
 
 class Settings(BaseSettings):
     BOT_TOKEN: str
@@ -20,6 +27,16 @@ class Settings(BaseSettings):
     REDIS_DSN: str
     LOG_LEVEL: str = "INFO"
     ALLOWED_UPDATES: List[str] = ["message", "callback_query", "inline_query"]
+    RUN_MODE: str = "polling"  # polling | ingress | worker
+    UPDATE_STREAM_SHARDS: int = DEFAULT_SHARDS
+    WORKER_INDEX: int = 0
+    WORKER_COUNT: int = 1
+    FEATURES: List[str] = ["quizzes", "gamification", "badges", "scratch_maps"]
+    OUTBOUND_ENABLED: bool = True
+    OUTBOUND_GLOBAL_RATE: int = DEFAULT_GLOBAL_RATE
+    OUTBOUND_PER_CHAT_RATE: int = DEFAULT_PER_CHAT_RATE
+    OUTBOUND_CONCURRENCY: int = DEFAULT_CONCURRENCY
+    METRICS_PORT: int = 0  # serve /metrics on this port when set
     class Config:
         env_file = ".env"
 
@@ -32,8 +49,9 @@ class BotApp:
         self.storage = RedisStorage.from_url(self.settings.REDIS_DSN, prefix="fsm:")
         self.bot = Bot(token=self.settings.BOT_TOKEN, parse_mode=ParseMode.HTML)
         self.dp = Dispatcher(storage=self.storage)
-        self.db_pool: asyncpg.Pool = None
+        self.db_pool: RawConnectionPool = None
         self.redis_client: aioredis.Redis = None
+        self.outbound: OutboundScheduler = None
 
         register_route_handlers(self.dp)
         register_quiz_handlers(self.dp)
@@ -41,22 +59,51 @@ class BotApp:
         register_geolocation_handlers(self.dp)
         logger.info("Handlers registered")
 
+        instrument_dispatcher(self.dp)
+        self.dp.update.outer_middleware(QueryScopeMiddleware())
+        instrument_bot(self.bot)
+
         self.dp.startup.register(self.on_startup)
         self.dp.shutdown.register(self.on_shutdown)
 
     async def on_startup(self):
         logger.info("Bot startup initiated")
         try:
-            self.db_pool = await asyncpg.create_pool(dsn=self.settings.DB_DSN)
+            init_db(async_database_url(self.settings.DB_DSN), **load_pool_options(application_name="bot"))
+            self.db_pool = RawConnectionPool(get_engine())
             logger.info("PostgreSQL pool created")
             self.redis_client = aioredis.from_url(
                 self.settings.REDIS_DSN, encoding="utf-8", decode_responses=True
             )
+            instrument_redis(self.redis_client)
             await self.redis_client.ping()
             logger.info("Redis client initialized")
 
             setattr(self.dp, "db_pool", self.db_pool)
             setattr(self.dp, "redis_client", self.redis_client)
+            self.dp.update.outer_middleware(
+                UserContextLoaderMiddleware(
+                    self.redis_client,
+                    self.db_pool,
+                    features=self.settings.FEATURES,
+                    activity_tracker=ActiveUserTracker(self.redis_client),
+                )
+            )
+            logger.info("User context middleware registered")
+
+            self.outbound = OutboundScheduler(
+                self.redis_client,
+                self.bot,
+                global_rate=self.settings.OUTBOUND_GLOBAL_RATE,
+                per_chat_rate=self.settings.OUTBOUND_PER_CHAT_RATE,
+                concurrency=self.settings.OUTBOUND_CONCURRENCY,
+            )
+            # Handler replies share the global budget with queued sends.
+            self.outbound.install(self.bot)
+            setattr(self.dp, "outbound", self.outbound)
+            if self.settings.OUTBOUND_ENABLED:
+                self.outbound.start()
+                logger.info("Outbound scheduler started")
 
             commands = [
                 BotCommand(command="start", description="Start the bot"),
@@ -78,7 +125,7 @@ class BotApp:
                     logger.exception("Failed to close Redis client during startup cleanup")
             if self.db_pool:
                 try:
-                    await self.db_pool.close()
+                    await dispose_db()
                     logger.info("PostgreSQL pool closed due to startup failure")
                 except Exception:
                     logger.exception("Failed to close DB pool during startup cleanup")
@@ -86,6 +133,12 @@ class BotApp:
 
     async def on_shutdown(self):
         logger.info("Bot shutdown initiated")
+        if self.outbound:
+            try:
+                await self.outbound.stop()
+                logger.info("Outbound scheduler stopped")
+            except Exception as e:
+                logger.exception("Error stopping outbound scheduler: %s", e)
         if self.redis_client:
             try:
                 await self.redis_client.close()
@@ -94,7 +147,7 @@ class BotApp:
                 logger.exception("Error closing Redis client: %s", e)
         if self.db_pool:
             try:
-                await self.db_pool.close()
+                await dispose_db()
                 logger.info("PostgreSQL pool closed")
             except Exception as e:
                 logger.exception("Error closing DB pool: %s", e)
@@ -113,12 +166,56 @@ class BotApp:
         logger.info("Bot shutdown completed")
 
     async def run(self):
+        if self.settings.METRICS_PORT:
+            start_http_server(self.settings.METRICS_PORT)
+            logger.info("Metrics served on port %s", self.settings.METRICS_PORT)
+        mode = self.settings.RUN_MODE
+        if mode == "ingress":
+            await self.run_ingress()
+        elif mode == "worker":
+            await self.run_worker()
+        else:
+            try:
+                await self.dp.start_polling(
+                    self.bot, allowed_updates=self.settings.ALLOWED_UPDATES
+                )
+            except Exception as e:
+                logger.exception("Polling has failed: %s", e)
+
+    async def run_ingress(self):
+        redis_client = aioredis.from_url(
+            self.settings.REDIS_DSN, encoding="utf-8", decode_responses=True
+        )
+        publisher = UpdateStreamPublisher(redis_client, shards=self.settings.UPDATE_STREAM_SHARDS)
         try:
-            await self.dp.start_polling(
-                self.bot, allowed_updates=self.settings.ALLOWED_UPDATES
-            )
+            await self.bot.delete_webhook(drop_pending_updates=False)
+            await publisher.run_polling(self.bot, allowed_updates=self.settings.ALLOWED_UPDATES)
+        except Exception as e:
+            logger.exception("Ingress has failed: %s", e)
+        finally:
+            await redis_client.close()
+            await self.bot.session.close()
+
+    async def run_worker(self):
+        shards = shards_for_worker(
+            self.settings.WORKER_INDEX,
+            self.settings.WORKER_COUNT,
+            self.settings.UPDATE_STREAM_SHARDS,
+        )
+        await self.dp.emit_startup(bot=self.bot)
+        worker = UpdateStreamWorker(
+            self.redis_client,
+            self.bot,
+            self.dp,
+            shards,
+            consumer=f"worker-{self.settings.WORKER_INDEX}",
+        )
+        try:
+            await worker.run()
         except Exception as e:
-            logger.exception("Polling has failed: %s", e)
+            logger.exception("Stream worker has failed: %s", e)
+        finally:
+            await self.dp.emit_shutdown(bot=self.bot)
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -0,0 +1,126 @@
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+RUN_TTL = 86400  # seconds a run's checkpoint is kept after it was last touched
+
+
+def run_key(run_id: str) -> str:
+    return f"bulk:{run_id}"
+
+
+def done_key(run_id: str) -> str:
+    return f"bulk:{run_id}:done"
+
+
+def slot_run_id(name: str, interval: int, now: Optional[float] = None) -> str:
+    """Name a run after its schedule slot so every retry of it shares one checkpoint."""
+    slot = int((now if now is not None else time.time()) // interval)
+    return f"{name}:{slot}"
+
+
+async def plan_chunks(session, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    Walk users.id with a keyset cursor and return inclusive (first_id, last_id)
+    ranges of at most `chunk_size` users each. Only ids are read.
+    """
+    from models import User
+    chunks: List[Tuple[int, int]] = []
+    last_id = 0
+    while True:
+        result = await session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+        )
+        ids = result.all()
+        if not ids:
+            break
+        chunks.append((ids[0], ids[-1]))
+        last_id = ids[-1]
+        if len(ids) < chunk_size:
+            break
+    return chunks
+
+
+class BulkRunCheckpoint:
+    """
+    Progress of one fan-out run, kept in the Redis hash `bulk:{run_id}`.
+
+    Finished chunks are recorded by their last user id in `bulk:{run_id}:done`,
+    so a run that is restarted after a crash only dispatches the remaining
+    chunks.
+    """
+
+    def __init__(self, redis_client, run_id: str):
+        self.redis = redis_client
+        self.run_id = run_id
+        self.key = run_key(run_id)
+        self.done_key = done_key(run_id)
+
+    def _touch(self, pipe) -> None:
+        pipe.expire(self.key, RUN_TTL)
+        pipe.expire(self.done_key, RUN_TTL)
+
+    def start(self, total_chunks: int) -> bool:
+        """Return False if the run already finished."""
+        if self.redis.hget(self.key, "status") in (b"done", "done"):
+            return False
+        pipe = self.redis.pipeline()
+        pipe.hsetnx(self.key, "started_at", time.time())
+        pipe.hset(self.key, mapping={"status": "running", "chunks": total_chunks})
+        self._touch(pipe)
+        pipe.execute()
+        return True
+
+    def pending(self, chunks: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        chunks = list(chunks)
+        if not chunks:
+            return []
+        done = self.redis.smismember(self.done_key, [last for _, last in chunks])
+        return [chunk for chunk, is_done in zip(chunks, done) if not is_done]
+
+    def chunk_done(self, last_id: int, enqueued: int) -> None:
+        pipe = self.redis.pipeline()
+        pipe.sadd(self.done_key, last_id)
+        pipe.hincrby(self.key, "enqueued", enqueued)
+        self._touch(pipe)
+        pipe.execute()
+
+    def chunk_failed(self, last_id: int) -> None:
+        logger.warning("Bulk run %s gave up on chunk ending at user %s", self.run_id, last_id)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key, "failed_chunks", 1)
+        self._touch(pipe)
+        pipe.execute()
+
+    def finish(self) -> Dict[str, Any]:
+        finished_at = time.time()
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.key)
+        pipe.scard(self.done_key)
+        state, done_chunks = pipe.execute()
+        state = {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in state.items()
+        }
+        failed_chunks = int(state.get("failed_chunks", 0))
+        status = "done" if not failed_chunks else "partial"
+        self.redis.hset(self.key, mapping={"status": status, "finished_at": finished_at})
+        duration = finished_at - float(state.get("started_at", finished_at))
+        enqueued = int(state.get("enqueued", 0))
+        report = {
+            "run_id": self.run_id,
+            "status": status,
+            "chunks": int(state.get("chunks", 0)),
+            "chunks_done": done_chunks,
+            "failed_chunks": failed_chunks,
+            "enqueued": enqueued,
+            "duration_seconds": round(duration, 3),
+            "messages_per_second": round(enqueued / duration, 2) if duration > 0 else None,
+        }
+        logger.info("Bulk run %s finished: %s", self.run_id, report)
+        return report
@@ -1,4 +1,7 @@
-from celery import Celery
+import asyncio
+import datetime
+import os
+from celery import Celery, chord, group
 from celery.schedules import crontab
 from app.config import settings
 
@@ -22,31 +25,149 @@ def make_celery():
 
 celery_app = make_celery()
 
+REDIS_URL = os.getenv("REDIS_URL", getattr(settings, "REDIS_URL", "redis://localhost:6379/0"))
+
+QR_BATCH_WORKERS = int(os.getenv("QR_BATCH_WORKERS", "0")) or None  # None: one per CPU
+BULK_NOTIFICATION_INTERVAL = 15 * 60  # seconds, matches the beat schedule
+BULK_NOTIFICATION_CHUNK_SIZE = int(os.getenv("BULK_NOTIFICATION_CHUNK_SIZE", "1000"))
+
+def _redis_client():
+    import redis
+    return redis.from_url(REDIS_URL)
+
+def _outbound_queue():
+    from outboundscheduler import OutboundQueue
+    return OutboundQueue(_redis_client())
+
 def register_tasks(celery):
     @celery.task(bind=True, name=f"{__name__}.send_daily_facts", default_retry_delay=60, max_retries=3)
     def send_daily_facts(self):
         try:
-            from app.services.fact_service import run_daily_facts
-            run_daily_facts()
+            from app.services.fact_service import render_daily_fact
+            job_id = f"daily-facts:{datetime.date.today().isoformat()}"
+            asyncio.run(_broadcast_by_cohort(job_id, render_daily_fact))
         except Exception as exc:
             raise self.retry(exc=exc)
 
+    # Runs in a prefork child; qrbatch renders through a billiard pool there.
     @celery.task(bind=True, name=f"{__name__}.generate_qr_codes_batch", default_retry_delay=60, max_retries=3)
     def generate_qr_codes_batch(self):
         try:
-            from app.services.qr_service import run_qr_generation
-            run_qr_generation()
+            from app.services.qr_service import list_qr_specs
+            from qrbatch import generate_batch
+            return generate_batch(list_qr_specs(), workers=QR_BATCH_WORKERS)
+        except Exception as exc:
+            raise self.retry(exc=exc)
+
+    @celery.task(bind=True, name=f"{__name__}.send_bulk_notification_chunk", default_retry_delay=60, max_retries=3)
+    def send_bulk_notification_chunk(self, run_id, first_id, last_id):
+        from bulkfanout import BulkRunCheckpoint
+        checkpoint = BulkRunCheckpoint(_redis_client(), run_id)
+        try:
+            from app.services.notification_service import run_bulk_notifications
+            # The outbound job is shared by the whole run, so a re-run chunk skips queued recipients.
+            with _outbound_queue().job(run_id) as outbound:
+                run_bulk_notifications(outbound=outbound, user_id_range=(first_id, last_id))
+        except Exception as exc:
+            if self.request.retries >= self.max_retries:
+                checkpoint.chunk_failed(last_id)
+                return {"last_id": last_id, "failed": True}
+            raise self.retry(exc=exc)
+        checkpoint.chunk_done(last_id, outbound.enqueued)
+        return {"last_id": last_id, "enqueued": outbound.enqueued}
+
+    @celery.task(bind=True, name=f"{__name__}.finalize_bulk_notifications", default_retry_delay=60, max_retries=3)
+    def finalize_bulk_notifications(self, results, run_id):
+        try:
+            from bulkfanout import BulkRunCheckpoint
+            return BulkRunCheckpoint(_redis_client(), run_id).finish()
         except Exception as exc:
             raise self.retry(exc=exc)
 
     @celery.task(bind=True, name=f"{__name__}.send_bulk_notifications", default_retry_delay=60, max_retries=3)
     def send_bulk_notifications(self):
         try:
-            from app.services.notification_service import run_bulk_notifications
-            run_bulk_notifications()
+            from bulkfanout import BulkRunCheckpoint, slot_run_id
+            run_id = slot_run_id("bulk-notifications", BULK_NOTIFICATION_INTERVAL)
+            chunks = asyncio.run(_plan_bulk_chunks())
+            checkpoint = BulkRunCheckpoint(_redis_client(), run_id)
+            if not checkpoint.start(len(chunks)):
+                return
+            pending = checkpoint.pending(chunks)
+            if not pending:
+                finalize_bulk_notifications.delay([], run_id)
+                return
+            chord(
+                group(send_bulk_notification_chunk.s(run_id, first_id, last_id) for first_id, last_id in pending)
+            )(finalize_bulk_notifications.s(run_id))
+        except Exception as exc:
+            raise self.retry(exc=exc)
+
+    @celery.task(bind=True, name=f"{__name__}.send_daily_route_suggestions", default_retry_delay=60, max_retries=3)
+    def send_daily_route_suggestions(self):
+        try:
+            from app.services.suggestion_service import render_route_suggestion
+            job_id = f"route-suggestions:{datetime.date.today().isoformat()}"
+            asyncio.run(_broadcast_by_cohort(job_id, render_route_suggestion))
+        except Exception as exc:
+            raise self.retry(exc=exc)
+
+    @celery.task(bind=True, name=f"{__name__}.send_weekly_summary", default_retry_delay=60, max_retries=3)
+    def send_weekly_summary(self):
+        try:
+            from app.services.summary_service import run_weekly_summary
+            year, week, _ = datetime.date.today().isocalendar()
+            with _outbound_queue().job(f"weekly-summary:{year}-W{week:02d}") as outbound:
+                run_weekly_summary(outbound=outbound)
+        except Exception as exc:
+            raise self.retry(exc=exc)
+
+    @celery.task(bind=True, name=f"{__name__}.reconcile_statistics", default_retry_delay=60, max_retries=3)
+    def reconcile_statistics(self):
+        try:
+            asyncio.run(_reconcile_statistics())
         except Exception as exc:
             raise self.retry(exc=exc)
 
+def _init_worker_db():
+    from database import async_database_url, init_db, load_pool_options
+    url = os.getenv("DATABASE_URL", getattr(settings, "DATABASE_URL", ""))
+    init_db(async_database_url(url), **load_pool_options(application_name="worker"))
+
+async def _broadcast_by_cohort(job_id, render):
+    from database import dispose_db, session_scope
+    from cohortbroadcast import broadcast_by_cohort
+    _init_worker_db()
+    try:
+        async with session_scope() as session:
+            return await broadcast_by_cohort(session, _outbound_queue().job(job_id), render)
+    finally:
+        await dispose_db()
+
+async def _plan_bulk_chunks():
+    from database import dispose_db, session_scope
+    from bulkfanout import plan_chunks
+    _init_worker_db()
+    try:
+        async with session_scope() as session:
+            return await plan_chunks(session, BULK_NOTIFICATION_CHUNK_SIZE)
+    finally:
+        await dispose_db()
+
+async def _reconcile_statistics():
+    import redis.asyncio as redis
+    from database import dispose_db, session_scope
+    from statsstore import reconcile_counters
+    _init_worker_db()
+    client = redis.from_url(REDIS_URL)
+    try:
+        async with session_scope() as session:
+            await reconcile_counters(session, client)
+    finally:
+        await client.close()
+        # asyncio.run gives each task a fresh loop; pooled connections must not outlive it.
+        await dispose_db()
+
 register_tasks(celery_app)
 
 def schedule_daily_facts(celery):
@@ -67,10 +188,17 @@ def schedule_bulk_notifications(celery):
         'schedule': crontab(minute='*/15'),
     }
 
+def schedule_statistics_reconciliation(celery):
+    celery.conf.beat_schedule['reconcile-statistics'] = {
+        'task': f"{__name__}.reconcile_statistics",
+        'schedule': crontab(minute=5),
+    }
+
 def setup_schedules(celery):
     celery.conf.beat_schedule = {}
     schedule_daily_facts(celery)
     schedule_qr_generation(celery)
     schedule_bulk_notifications(celery)
+    schedule_statistics_reconciliation(celery)
 
 setup_schedules(celery_app)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 5000
+
+# Ad-free is granted by premium today (see usercontextmiddleware.PREMIUM_FLAGS);
+# it is kept as its own cohort dimension so renderers do not have to know that.
+PREMIUM_SQL = """
+EXISTS (
+    SELECT 1 FROM subscriptions s
+    WHERE s.user_id = u.id AND s.status = 'active' AND s.expires_at > now()
+)
+"""
+
+COHORTS_SQL = f"""
+SELECT u.language_code, {PREMIUM_SQL} AS premium, count(*) AS recipients
+FROM users u
+GROUP BY 1, 2
+"""
+
+COHORT_RECIPIENTS_SQL = f"""
+SELECT u.id, u.telegram_id
+FROM users u
+WHERE u.language_code = :language
+  AND {PREMIUM_SQL} = :premium
+  AND u.id > :after_id
+ORDER BY u.id
+LIMIT :limit
+"""
+
+
+class Cohort(NamedTuple):
+    language: str
+    premium: bool
+    ad_free: bool
+
+    @property
+    def name(self) -> str:
+        return f"{self.language}:{'premium' if self.premium else 'free'}:{'noads' if self.ad_free else 'ads'}"
+
+
+@dataclass
+class CohortMessage:
+    """
+    A message rendered once for a whole cohort. `media` names the file in
+    `params` so it is uploaded once and its file_id reused afterwards.
+    """
+    method: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    media: Optional[str] = None
+
+
+async def list_cohorts(session) -> List[tuple]:
+    result = await session.execute(text(COHORTS_SQL))
+    return [
+        (Cohort(language, bool(premium), bool(premium)), recipients)
+        for language, premium, recipients in result.all()
+    ]
+
+
+async def broadcast_by_cohort(
+    session,
+    job,
+    render: Callable[[Cohort], Optional[CohortMessage]],
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Dict[str, int]:
+    """
+    Render `render(cohort)` once per (language, premium, ad-free) cohort,
+    store it as an outbound template and enqueue one template reference per
+    recipient, walking each cohort with a keyset cursor. `job` is an
+    outboundscheduler.OutboundJob. Returns the number of recipients enqueued
+    per cohort; cohorts the renderer returns None for are skipped.
+    """
+    enqueued: Dict[str, int] = {}
+    for cohort, recipients in await list_cohorts(session):
+        message = render(cohort)
+        if message is None:
+            continue
+        key = job.queue.put_template(job.job_id, cohort.name, message.method, message.params, message.media)
+        before = job.enqueued
+        after_id = 0
+        while True:
+            rows = (await session.execute(text(COHORT_RECIPIENTS_SQL), {
+                "language": cohort.language,
+                "premium": cohort.premium,
+                "after_id": after_id,
+                "limit": page_size,
+            })).all()
+            if not rows:
+                break
+            for _, telegram_id in rows:
+                job.send_template(telegram_id, key)
+            after_id = rows[-1][0]
+            if len(rows) < page_size:
+                break
+        job.flush()
+        enqueued[cohort.name] = job.enqueued - before
+        logger.info("Cohort %s: %d of %d recipients enqueued", cohort.name, enqueued[cohort.name], recipients)
+    return enqueued
@@ -1,8 +1,14 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from .models import User, Route
 from .schemas import UserCreate, UserUpdate, RouteCreate, RouteUpdate
+from .routeevents import notify_routes_changed
+from .pagination import apply_keyset, split_page
+from .statsstore import record_counter
+from .usercontextmiddleware import invalidate_user_context
+
+ROUTE_SORT_KEYS = ("id", "created_at", "updated_at")
 
 async def create_user(db: AsyncSession, user: UserCreate) -> User:
     db_user = User(**user.dict())
@@ -13,6 +19,9 @@ async def create_user(db: AsyncSession, user: UserCreate) -> User:
     except Exception:
         await db.rollback()
         raise
+    await record_counter("users", 1)
+    # Replaces a cached "unknown user" entry.
+    await invalidate_user_context(db_user.telegram_id)
     return db_user
 
 async def get_user(db: AsyncSession, user_id: int) -> Optional[User]:
@@ -32,6 +41,7 @@ async def update_user(db: AsyncSession, user_id: int, data: UserUpdate) -> Optio
     except Exception:
         await db.rollback()
         raise
+    await invalidate_user_context(db_user.telegram_id)
     return db_user
 
 async def delete_user(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]]:
@@ -45,6 +55,8 @@ async def delete_user(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]
     except Exception:
         await db.rollback()
         raise
+    await record_counter("users", -1)
+    await invalidate_user_context(snapshot["telegram_id"])
     return snapshot
 
 async def get_route(db: AsyncSession, route_id: int) -> Optional[Route]:
@@ -52,10 +64,23 @@ async def get_route(db: AsyncSession, route_id: int) -> Optional[Route]:
     return result.scalars().first()
 
 async def list_routes(db: AsyncSession, filters: Dict[str, Any] = None) -> List[Route]:
+    routes, _ = await list_routes_page(db, filters)
+    return routes
+
+async def list_routes_page(db: AsyncSession, filters: Dict[str, Any] = None) -> Tuple[List[Route], Optional[str]]:
+    """
+    Like list_routes, but also returns the continuation cursor for the next
+    page. Pass it back as filters["cursor"] to continue with a keyset seek
+    instead of OFFSET; "skip" is still honoured when no cursor is given.
+    """
     filters = filters or {}
     filter_params = filters.copy()
     skip = filter_params.pop("skip", 0)
     limit = filter_params.pop("limit", 100)
+    cursor = filter_params.pop("cursor", None)
+    sort = filter_params.pop("sort", "id")
+    if sort not in ROUTE_SORT_KEYS:
+        raise ValueError(f"Unsupported sort field: {sort}")
     allowed_filters = {col.name for col in Route.__table__.columns}
     unsupported = set(filter_params.keys()) - allowed_filters
     if unsupported:
@@ -64,9 +89,11 @@ async def list_routes(db: AsyncSession, filters: Dict[str, Any] = None) -> List[
     for field, value in filter_params.items():
         if value is not None:
             query = query.where(getattr(Route, field) == value)
-    query = query.offset(skip).limit(limit)
+    query = apply_keyset(query, getattr(Route, sort), Route.id, cursor, sort, limit)
+    if not cursor and skip:
+        query = query.offset(skip)
     result = await db.execute(query)
-    return result.scalars().all()
+    return split_page(result.scalars().all(), limit, sort, sort)
 
 async def create_route(db: AsyncSession, route: RouteCreate) -> Route:
     db_route = Route(**route.dict())
@@ -77,6 +104,8 @@ async def create_route(db: AsyncSession, route: RouteCreate) -> Route:
     except Exception:
         await db.rollback()
         raise
+    await notify_routes_changed()
+    await record_counter("routes", 1)
     return db_route
 
 async def update_route(db: AsyncSession, route_id: int, data: RouteUpdate) -> Optional[Route]:
@@ -92,6 +121,7 @@ async def update_route(db: AsyncSession, route_id: int, data: RouteUpdate) -> Op
     except Exception:
         await db.rollback()
         raise
+    await notify_routes_changed()
     return db_route
 
 async def delete_route(db: AsyncSession, route_id: int) -> Optional[Dict[str, Any]]:
@@ -105,4 +135,6 @@ async def delete_route(db: AsyncSession, route_id: int) -> Optional[Dict[str, An
     except Exception:
         await db.rollback()
         raise
+    await notify_routes_changed()
+    await record_counter("routes", -1)
     return snapshot
\ No newline at end of file
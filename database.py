@@ -1,9 +1,13 @@
+import os
 import threading
 import logging
-from typing import Optional, AsyncGenerator
+from configparser import ConfigParser
+from typing import Any, Dict, Optional, AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from contextlib import asynccontextmanager
+from metrics import instrument_engine
+from querydiagnostics import observe_query, query_scope
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +19,55 @@ _db_uri: Optional[str] = None
 _db_echo: Optional[bool] = None
 _init_lock = threading.Lock()
 
-def init_db(uri: str, echo: bool = False) -> None:
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 1800  # seconds
+DEFAULT_POOL_TIMEOUT = 30  # seconds
+DEFAULT_STATEMENT_CACHE_SIZE = 100
+DEFAULT_APPLICATION_NAME = "beltourbot"
+
+def async_database_url(url: str) -> str:
+    """Point plain postgres:// DSNs at the asyncpg driver."""
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+def pool_options_from_config(config: Optional[ConfigParser], application_name: Optional[str] = None,
+                             section: str = "database") -> Dict[str, Any]:
+    """
+    Engine keyword arguments for init_db() from the [database] section.
+    Every process gets one pool sized here, so pool_size + max_overflow times
+    the number of processes must stay below Postgres max_connections.
+    """
+    def get(option, getter, default):
+        if config is None or not config.has_option(section, option):
+            return default
+        return getattr(config, getter)(section, option)
+
+    app_name = get("application_name", "get", DEFAULT_APPLICATION_NAME)
+    if application_name:
+        app_name = f"{app_name}-{application_name}"
+    return {
+        "pool_size": get("pool_size", "getint", DEFAULT_POOL_SIZE),
+        "max_overflow": get("max_overflow", "getint", DEFAULT_MAX_OVERFLOW),
+        "pool_pre_ping": get("pool_pre_ping", "getboolean", True),
+        "pool_recycle": get("pool_recycle", "getint", DEFAULT_POOL_RECYCLE),
+        "pool_timeout": get("pool_timeout", "getint", DEFAULT_POOL_TIMEOUT),
+        "connect_args": {
+            "statement_cache_size": get("statement_cache_size", "getint", DEFAULT_STATEMENT_CACHE_SIZE),
+            "server_settings": {"application_name": app_name},
+        },
+    }
+
+def load_pool_options(application_name: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """pool_options_from_config() for entry points that do not load config.ini themselves."""
+    config = ConfigParser()
+    if not config.read(path or os.getenv("CONFIG_PATH", "config.ini")):
+        config = None
+    return pool_options_from_config(config, application_name)
+
+def init_db(uri: str, echo: bool = False, **engine_options: Any) -> None:
     global _engine, _SessionMaker, _db_uri, _db_echo
     if _engine is not None:
         if uri != _db_uri or echo != _db_echo:
@@ -32,7 +84,8 @@ def init_db(uri: str, echo: bool = False) -> None:
                     _db_uri, _db_echo, uri, echo
                 )
             return
-        _engine = create_async_engine(uri, echo=echo, future=True)
+        _engine = create_async_engine(uri, echo=echo, future=True, **engine_options)
+        instrument_engine(_engine, observers=[observe_query])
         _SessionMaker = sessionmaker(bind=_engine, class_=AsyncSession, expire_on_commit=False)
         _db_uri = uri
         _db_echo = echo
@@ -42,11 +95,21 @@ def get_engine() -> AsyncEngine:
         raise RuntimeError("Database engine is not initialized. Call init_db() first.")
     return _engine
 
+def get_sessionmaker() -> sessionmaker:
+    if _SessionMaker is None:
+        raise RuntimeError("Session maker is not initialized. Call init_db() first.")
+    return _SessionMaker
+
 def get_session() -> AsyncSession:
     if _SessionMaker is None:
         raise RuntimeError("Session maker is not initialized. Call init_db() first.")
     return _SessionMaker()
 
+async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency: one session per request, closed once the request is done."""
+    async with get_sessionmaker()() as session:
+        yield session
+
 async def dispose_db() -> None:
     global _engine, _SessionMaker, _db_uri, _db_echo
     if _engine is not None:
@@ -56,14 +119,30 @@ async def dispose_db() -> None:
         _db_uri = None
         _db_echo = None
 
+class RawConnectionPool:
+    """
+    asyncpg-style `acquire()` over the shared engine's pool, for code that
+    runs raw driver queries (conn.fetch etc.) without a second pool.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self.engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            yield raw.driver_connection
+
 @asynccontextmanager
-async def session_scope() -> AsyncGenerator[AsyncSession, None]:
+async def session_scope(name: str = "session_scope") -> AsyncGenerator[AsyncSession, None]:
     session = get_session()
-    try:
-        yield session
-        await session.commit()
-    except:
-        await session.rollback()
-        raise
-    finally:
-        await session.close()
\ No newline at end of file
+    with query_scope(name):
+        try:
+            yield session
+            await session.commit()
+        except:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
\ No newline at end of file
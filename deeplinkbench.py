@@ -0,0 +1,39 @@
+import argparse
+import logging
+import timeit
+
+import deeplinkservice
+
+SAMPLE_PAYLOAD = {"route_id": 1842, "ref": 570213994, "src": "share", "lang": "be"}
+
+
+def bench(version: int, number: int) -> dict:
+    token = deeplinkservice.generate_token(SAMPLE_PAYLOAD, version=version)
+    generate = timeit.timeit(lambda: deeplinkservice.generate_token(SAMPLE_PAYLOAD, version=version), number=number)
+    parse = timeit.timeit(lambda: deeplinkservice.parse_deeplink(token), number=number)
+    return {
+        "version": version,
+        "length": len(token),
+        "generate_us": generate / number * 1e6,
+        "parse_us": parse / number * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare deep link token formats")
+    parser.add_argument("--number", type=int, default=100000, help="iterations per measurement")
+    args = parser.parse_args()
+    # v1 tokens for this payload exceed the start parameter limit; keep the warning out of the timings.
+    logging.getLogger("deeplinkservice").setLevel(logging.ERROR)
+    print(f"payload: {SAMPLE_PAYLOAD}")
+    print(f"{'version':<8} {'length':>6} {'generate us':>12} {'parse us':>10}")
+    for version in (1, 2):
+        result = bench(version, args.number)
+        print(
+            f"v{result['version']:<7} {result['length']:>6} "
+            f"{result['generate_us']:>12.2f} {result['parse_us']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
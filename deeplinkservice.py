@@ -1,13 +1,17 @@
+import asyncio
 import base64
 import binascii
 import hashlib
 import hmac
 import json
 import logging
+import secrets
 import time
-from typing import Any, Dict, Optional
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import urlencode, urlparse, parse_qs
 from app.core.config import settings
+from core.redis import redis_client
 
 logger = logging.getLogger(__name__)
 
@@ -26,27 +30,191 @@ if TTL is not None:
     except Exception as e:
         raise RuntimeError(f"Invalid deep_link_url_expiry configuration: {e}")
 
-def generate_deeplink(payload: Dict[str, Any]) -> str:
-    data = dict(payload)
-    if TTL is not None:
-        data["_ts"] = int(time.time())
+MAX_START_PARAM_LENGTH = 64
+SHORT_LINKS = bool(getattr(settings, "deep_link_short_links", False))
+SHORT_LINK_TTL = int(getattr(settings, "deep_link_short_ttl", 90 * 86400))
+SHORT_PREFIX = "s"
+SHORT_ID_BYTES = 6  # eight base64url characters
+CLICK_FLUSH_INTERVAL = 10  # seconds
+TOKEN_VERSION = int(getattr(settings, "deep_link_token_version", 2))
+
+# Compact v2 tokens: "2" + base64url(fields || mac). v1 tokens are base64 of a
+# JSON object and always start with "e", so the first character selects the
+# parser. Fields are (one-byte tag, value) pairs typed by this registry, with
+# integers and string lengths as varints; payloads with other keys or values
+# fall back to v1. The MAC is keyed BLAKE2b truncated to eight bytes.
+V2_PREFIX = "2"
+V2_MAC_BYTES = 8
+V2_TS_EPOCH = 1704067200  # 2024-01-01T00:00:00Z, keeps _ts to four bytes
+FIELD_UINT = "uint"
+FIELD_STR = "str"
+FIELD_BOOL = "bool"
+V2_FIELDS: Dict[str, Tuple[int, str]] = {
+    "_ts": (0, FIELD_UINT),
+    "route_id": (1, FIELD_UINT),
+    "ref": (2, FIELD_UINT),
+    "quiz_id": (3, FIELD_UINT),
+    "badge_id": (4, FIELD_UINT),
+    "location_id": (5, FIELD_UINT),
+    "action": (6, FIELD_STR),
+    "lang": (7, FIELD_STR),
+    "src": (8, FIELD_STR),
+    "premium": (9, FIELD_BOOL),
+}
+_V2_KEY = hashlib.sha256(b"deeplink-v2:" + SECRET_KEY.encode("utf-8")).digest()
+V2_TAGS: Dict[int, Tuple[str, str]] = {tag: (name, kind) for name, (tag, kind) in V2_FIELDS.items()}
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _v2_mac(body: bytes) -> bytes:
+    return hashlib.blake2b(body, key=_V2_KEY, digest_size=V2_MAC_BYTES).digest()
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("varint too long")
+
+def _encode_v2(data: Dict[str, Any]) -> Optional[str]:
+    body = bytearray()
+    for name, value in data.items():
+        field = V2_FIELDS.get(name)
+        if field is None:
+            return None
+        tag, kind = field
+        if kind == FIELD_BOOL:
+            if not isinstance(value, bool):
+                return None
+            body.append(tag)
+            body.append(int(value))
+        elif kind == FIELD_UINT:
+            if isinstance(value, bool) or not isinstance(value, int):
+                return None
+            if name == "_ts":
+                value -= V2_TS_EPOCH
+            if value < 0:
+                return None
+            body.append(tag)
+            _put_varint(body, value)
+        else:
+            if not isinstance(value, str):
+                return None
+            raw = value.encode("utf-8")
+            body.append(tag)
+            _put_varint(body, len(raw))
+            body += raw
+    body = bytes(body)
+    return V2_PREFIX + _b64encode(body + _v2_mac(body))
+
+def _decode_v2(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        raw = _b64decode(token[len(V2_PREFIX):])
+    except (binascii.Error, ValueError) as e:
+        logger.warning("Invalid base64 data in deep link: %s", e)
+        return None
+    if len(raw) < V2_MAC_BYTES:
+        logger.warning("Deep link token has invalid format")
+        return None
+    body, mac = raw[:-V2_MAC_BYTES], raw[-V2_MAC_BYTES:]
+    if not hmac.compare_digest(mac, _v2_mac(body)):
+        logger.warning("Signature mismatch in deep link")
+        return None
+    data: Dict[str, Any] = {}
+    end = len(body)
+    pos = 0
+    try:
+        while pos < end:
+            name, kind = V2_TAGS[body[pos]]
+            pos += 1
+            if kind == FIELD_BOOL:
+                data[name] = bool(body[pos])
+                pos += 1
+                continue
+            # Varints below 0x80 are a single byte; skip the helper for them.
+            value = body[pos]
+            if value < 0x80:
+                pos += 1
+            else:
+                value, pos = _get_varint(body, pos)
+            if kind == FIELD_UINT:
+                data[name] = value + V2_TS_EPOCH if name == "_ts" else value
+            else:
+                if pos + value > end:
+                    raise ValueError("string field overruns token")
+                data[name] = body[pos:pos + value].decode("utf-8")
+                pos += value
+    except (IndexError, KeyError, ValueError) as e:
+        logger.warning("Invalid field data in deep link: %s", e)
+        return None
+    return data
+
+def _encode_v1(data: Dict[str, Any]) -> str:
     json_bytes = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
     data_b64 = base64.urlsafe_b64encode(json_bytes).rstrip(b"=").decode("ascii")
     sig = hmac.new(SECRET_KEY.encode("utf-8"), json_bytes, hashlib.sha256).digest()
     sig_b64 = base64.urlsafe_b64encode(sig).rstrip(b"=").decode("ascii")
-    token = f"{data_b64}.{sig_b64}"
-    return f"{BASE_URL}?{urlencode({'start': token})}"
+    return f"{data_b64}.{sig_b64}"
 
-def parse_deeplink(link: str) -> Optional[Dict[str, Any]]:
-    token = link
-    if link.startswith(("http://", "https://")):
-        parsed = urlparse(link)
-        qs = parse_qs(parsed.query)
-        values = qs.get("start") or qs.get("startgroup") or []
-        if not values:
-            logger.warning("No deep link token found in query string")
+def generate_token(payload: Dict[str, Any], version: int = TOKEN_VERSION) -> str:
+    data = dict(payload)
+    if TTL is not None:
+        data["_ts"] = int(time.time())
+    token = _encode_v2(data) if version >= 2 else None
+    if token is None or len(token) > MAX_START_PARAM_LENGTH:
+        token = _encode_v1(data)
+    if len(token) > MAX_START_PARAM_LENGTH:
+        logger.warning("Deep link token is %d characters, over Telegram's start parameter limit", len(token))
+    return token
+
+def generate_deeplink(payload: Dict[str, Any], version: int = TOKEN_VERSION) -> str:
+    return f"{BASE_URL}?{urlencode({'start': generate_token(payload, version)})}"
+
+def _extract_token(link: str) -> Optional[str]:
+    if not link.startswith(("http://", "https://")):
+        return link
+    qs = parse_qs(urlparse(link).query)
+    values = qs.get("start") or qs.get("startgroup") or []
+    if not values:
+        logger.warning("No deep link token found in query string")
+        return None
+    return values[0]
+
+def _check_expiry(data_obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if TTL is not None:
+        ts = data_obj.get("_ts")
+        if not isinstance(ts, int):
+            logger.warning("Timestamp missing or invalid in deep link")
             return None
-        token = values[0]
+        if time.time() - ts > TTL:
+            logger.warning("Deep link has expired")
+            return None
+        data_obj.pop("_ts", None)
+    return data_obj
+
+def parse_deeplink(link: str) -> Optional[Dict[str, Any]]:
+    token = _extract_token(link)
+    if token is None:
+        return None
+    if token.startswith(V2_PREFIX):
+        data_obj = _decode_v2(token)
+        return _check_expiry(data_obj) if data_obj is not None else None
     parts = token.split(".")
     if len(parts) != 2:
         logger.warning("Deep link token has invalid format")
@@ -76,13 +244,93 @@ def parse_deeplink(link: str) -> Optional[Dict[str, Any]]:
     if not hmac.compare_digest(expected_sig, sig_bytes):
         logger.warning("Signature mismatch in deep link")
         return None
-    if TTL is not None:
-        ts = data_obj.get("_ts")
-        if not isinstance(ts, int):
-            logger.warning("Timestamp missing or invalid in deep link")
-            return None
-        if time.time() - ts > TTL:
-            logger.warning("Deep link has expired")
-            return None
-        data_obj.pop("_ts", None)
-    return data_obj
\ No newline at end of file
+    return _check_expiry(data_obj)
+
+def short_link_key(link_id: str) -> str:
+    return f"dl:s:{link_id}"
+
+def short_link_stats_key(link_id: str) -> str:
+    return f"dl:stats:{link_id}"
+
+class ClickBuffer:
+    """
+    Counts short-link clicks and conversions in memory and flushes them as
+    HINCRBY batches, so tracking adds no Redis write to /start.
+    """
+
+    def __init__(self, redis, flush_interval: float = CLICK_FLUSH_INTERVAL):
+        self.redis = redis
+        self.flush_interval = flush_interval
+        self._pending: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def incr(self, link_id: str, field: str = "clicks", amount: int = 1) -> None:
+        self._pending[(link_id, field)] += amount
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for (link_id, field), amount in pending.items():
+                key = short_link_stats_key(link_id)
+                pipe.hincrby(key, field, amount)
+                pipe.expire(key, SHORT_LINK_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("Failed to flush %d deep link counters: %s", len(pending), e)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+link_clicks = ClickBuffer(redis_client)
+
+async def create_short_link(payload: Dict[str, Any], ttl: int = SHORT_LINK_TTL) -> str:
+    """Store `payload` under a random id and return its start parameter."""
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    for _ in range(5):
+        link_id = secrets.token_urlsafe(SHORT_ID_BYTES)
+        if await redis_client.set(short_link_key(link_id), body, ex=ttl, nx=True):
+            return SHORT_PREFIX + link_id
+    raise RuntimeError("Could not allocate a unique short link id")
+
+async def generate_share_link(payload: Dict[str, Any]) -> str:
+    """Short link when deep_link_short_links is enabled, a signed token otherwise."""
+    if not SHORT_LINKS:
+        return generate_deeplink(payload)
+    return f"{BASE_URL}?{urlencode({'start': await create_short_link(payload)})}"
+
+async def resolve_deeplink(link: str) -> Optional[Dict[str, Any]]:
+    """
+    Like parse_deeplink, but also resolves short links with a single GET and
+    counts the click. The resolved payload carries the link id as `_link`
+    so handlers can report a conversion with record_conversion().
+    """
+    token = _extract_token(link)
+    if token is None:
+        return None
+    if not token.startswith(SHORT_PREFIX):
+        return parse_deeplink(token)
+    link_id = token[len(SHORT_PREFIX):]
+    try:
+        body = await redis_client.get(short_link_key(link_id))
+    except Exception as e:
+        logger.warning("Redis error resolving short link %s: %s", link_id, e)
+        return None
+    if body is None:
+        logger.warning("Short link %s is unknown or expired", link_id)
+        return None
+    link_clicks.incr(link_id)
+    data_obj = json.loads(body)
+    data_obj["_link"] = link_id
+    return data_obj
+
+def record_conversion(payload: Dict[str, Any], field: str = "conversions") -> None:
+    link_id = payload.get("_link")
+    if link_id:
+        link_clicks.incr(link_id, field)
@@ -1,68 +1,67 @@
-import logging
-import asyncio
 from fastapi import APIRouter, status
 from starlette.responses import JSONResponse
 from starlette.concurrency import run_in_threadpool
 from sqlalchemy import text
-from database import engine as async_engine
+from database import get_engine
 from bot import redis_client
 from celery_worker import celery_app
+from healthprober import HealthProber, ProbeFailed
 
 router = APIRouter()
 
 DB_TIMEOUT = 5
 REDIS_TIMEOUT = 2
 CELERY_TIMEOUT = 5
+PROBE_INTERVAL = 10
+CELERY_PROBE_INTERVAL = 30
 
 @router.get("/healthcheck", include_in_schema=False)
 async def healthcheck():
     return JSONResponse({"status": "ok"})
 
-@router.get("/readiness", include_in_schema=False)
-async def readiness():
-    errors = {}
+async def _check_database():
+    async with get_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+async def _check_redis():
+    await redis_client.ping()
+
+async def _check_celery():
+    def _ping():
+        response = celery_app.control.inspect(timeout=1).ping()
+        if not response:
+            raise ProbeFailed("no workers")
+    await run_in_threadpool(_ping)
 
-    # Database readiness check
-    try:
-        async def _db_check():
-            async with async_engine.connect() as conn:
-                await conn.execute(text("SELECT 1"))
-        await asyncio.wait_for(_db_check(), timeout=DB_TIMEOUT)
-    except asyncio.TimeoutError:
-        logging.exception("Database readiness check timed out")
-        errors["database"] = "timeout"
-    except Exception:
-        logging.exception("Database readiness check failed")
-        errors["database"] = "unavailable"
+prober = HealthProber()
+prober.register("database", _check_database, interval=PROBE_INTERVAL, timeout=DB_TIMEOUT)
+prober.register("redis", _check_redis, interval=PROBE_INTERVAL, timeout=REDIS_TIMEOUT)
+# The ping is broadcast to every worker, so it runs least often.
+prober.register("celery", _check_celery, interval=CELERY_PROBE_INTERVAL, timeout=CELERY_TIMEOUT)
 
-    # Redis readiness check
-    try:
-        await asyncio.wait_for(redis_client.ping(), timeout=REDIS_TIMEOUT)
-    except asyncio.TimeoutError:
-        logging.exception("Redis readiness check timed out")
-        errors["redis"] = "timeout"
-    except Exception:
-        logging.exception("Redis readiness check failed")
-        errors["redis"] = "unavailable"
+@router.on_event("startup")
+async def start_prober():
+    # Serve real results from the first request instead of "pending".
+    await prober.probe_all()
+    prober.start()
 
-    # Celery readiness check
-    try:
-        def _check_celery():
-            response = celery_app.control.inspect(timeout=1).ping()
-            if not response:
-                raise RuntimeError("No running Celery workers")
-        await asyncio.wait_for(run_in_threadpool(_check_celery), timeout=CELERY_TIMEOUT)
-    except asyncio.TimeoutError:
-        logging.exception("Celery readiness check timed out")
-        errors["celery"] = "timeout"
-    except Exception:
-        logging.exception("Celery readiness check failed")
-        errors["celery"] = "unavailable"
+@router.on_event("shutdown")
+async def stop_prober():
+    await prober.stop()
+
+@router.get("/readiness", include_in_schema=False)
+async def readiness():
+    components = prober.snapshot()
+    errors = {
+        name: "unavailable" if component["info"] == "error" else component["info"]
+        for name, component in components.items()
+        if not component["healthy"]
+    }
 
     if errors:
         return JSONResponse(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            content={"status": "unready", "errors": errors},
+            content={"status": "unready", "errors": errors, "components": components},
         )
 
-    return JSONResponse({"status": "ready"})
\ No newline at end of file
+    return JSONResponse({"status": "ready", "components": components})
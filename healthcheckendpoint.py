@@ -5,7 +5,6 @@ import logging
 from fastapi import APIRouter, Depends, Response, status, HTTPException, Security
 from fastapi.responses import JSONResponse
 from fastapi.security.api_key import APIKeyHeader
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
@@ -14,6 +13,8 @@ from app.db.session import get_db
 from app.cache.redis import redis
 from celery import current_app as celery_app
 
+from healthprober import HealthProber, ProbeFailed
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
@@ -34,68 +35,49 @@ TIMEOUT_DB = getattr(settings, 'HEALTHCHECK_TIMEOUT_DB', 2)
 TIMEOUT_REDIS = getattr(settings, 'HEALTHCHECK_TIMEOUT_REDIS', 2)
 TIMEOUT_CELERY = getattr(settings, 'HEALTHCHECK_TIMEOUT_CELERY', 2)
 
-async def check_database(db: AsyncSession):
+PROBE_INTERVAL = getattr(settings, 'HEALTHCHECK_PROBE_INTERVAL', 10)
+CELERY_PROBE_INTERVAL = getattr(settings, 'HEALTHCHECK_CELERY_PROBE_INTERVAL', 30)
+
+async def check_database():
+    # Close the dependency generator explicitly, also when wait_for cancels
+    # the probe, so a timed-out check does not leak its session.
+    sessions = get_db()
     try:
-        await asyncio.wait_for(db.execute(text("SELECT 1")), timeout=TIMEOUT_DB)
-        return {'name': 'database', 'healthy': True}
-    except asyncio.TimeoutError as e:
-        return {'name': 'database', 'healthy': False, 'info': 'timeout', 'error': e}
-    except Exception as e:
-        return {'name': 'database', 'healthy': False, 'info': 'error', 'error': e}
+        db = await sessions.__anext__()
+        await db.execute(text("SELECT 1"))
+    finally:
+        await sessions.aclose()
 
 async def check_redis():
-    try:
-        pong = await asyncio.wait_for(redis.ping(), timeout=TIMEOUT_REDIS)
-        if pong:
-            return {'name': 'redis', 'healthy': True}
-        else:
-            return {'name': 'redis', 'healthy': False, 'info': 'no response'}
-    except asyncio.TimeoutError as e:
-        return {'name': 'redis', 'healthy': False, 'info': 'timeout', 'error': e}
-    except Exception as e:
-        return {'name': 'redis', 'healthy': False, 'info': 'error', 'error': e}
+    if not await redis.ping():
+        raise ProbeFailed("no response")
 
 async def check_celery():
     loop = asyncio.get_running_loop()
-    try:
-        inspect = celery_app.control.inspect(timeout=1)
-        result = await asyncio.wait_for(loop.run_in_executor(None, inspect.ping), timeout=TIMEOUT_CELERY)
-        if result:
-            return {'name': 'celery', 'healthy': True}
-        else:
-            return {'name': 'celery', 'healthy': False, 'info': 'no workers'}
-    except asyncio.TimeoutError as e:
-        return {'name': 'celery', 'healthy': False, 'info': 'timeout', 'error': e}
-    except Exception as e:
-        return {'name': 'celery', 'healthy': False, 'info': 'error', 'error': e}
+    inspect = celery_app.control.inspect(timeout=1)
+    if not await loop.run_in_executor(None, inspect.ping):
+        raise ProbeFailed("no workers")
 
-@router.get("/health", tags=["Health"], summary="Health Check")
-async def healthcheck(db: AsyncSession = Depends(get_db)):
-    checks = {}
-    overall_ok = True
-
-    results = await asyncio.gather(
-        check_database(db),
-        check_redis(),
-        check_celery()
-    )
+prober = HealthProber()
+prober.register('database', check_database, interval=PROBE_INTERVAL, timeout=TIMEOUT_DB)
+prober.register('redis', check_redis, interval=PROBE_INTERVAL, timeout=TIMEOUT_REDIS)
+prober.register('celery', check_celery, interval=CELERY_PROBE_INTERVAL, timeout=TIMEOUT_CELERY)
+
+@router.on_event("startup")
+async def start_prober():
+    # Serve real results from the first request instead of "pending".
+    await prober.probe_all()
+    prober.start()
 
-    for result in results:
-        name = result['name']
-        healthy = result['healthy']
-        info = result.get('info')
-        error = result.get('error')
-
-        if healthy:
-            checks[name] = "ok"
-        else:
-            overall_ok = False
-            if info in ('timeout', 'no workers', 'no response'):
-                checks[name] = info
-            else:
-                checks[name] = "error"
-            if error:
-                logger.error(f"{name} health check failed", exc_info=error)
+@router.on_event("shutdown")
+async def stop_prober():
+    await prober.stop()
+
+@router.get("/health", tags=["Health"], summary="Health Check")
+async def healthcheck():
+    components = prober.snapshot()
+    checks = {name: "ok" if component["healthy"] else component["info"] for name, component in components.items()}
+    overall_ok = all(component["healthy"] for component in components.values())
 
     status_code = status.HTTP_200_OK if overall_ok else status.HTTP_503_SERVICE_UNAVAILABLE
     return JSONResponse(
@@ -103,6 +85,7 @@ async def healthcheck(db: AsyncSession = Depends(get_db)):
         content={
             "status": "ok" if overall_ok else "error",
             "checks": checks,
+            "components": components,
             "version": settings.VERSION,
             "environment": settings.ENVIRONMENT,
             "uptime_seconds": round(time.monotonic() - start_time, 2),
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 10.0  # seconds between probes of one component
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_JITTER = 0.2  # +/- fraction of the interval
+STALE_AFTER_INTERVALS = 3
+
+
+class ProbeFailed(Exception):
+    """Raised by a check to report an unhealthy component with a short reason."""
+
+
+@dataclass
+class ProbeResult:
+    healthy: Optional[bool] = None  # None until the first probe finishes
+    info: str = "pending"
+    checked_at: Optional[float] = None  # wall clock, for reporting
+    checked_monotonic: Optional[float] = None
+    duration: Optional[float] = None
+
+
+@dataclass
+class _Probe:
+    name: str
+    check: Callable[[], Awaitable[Any]]
+    interval: float
+    timeout: float
+    result: ProbeResult
+    task: Optional[asyncio.Task] = None
+
+
+class HealthProber:
+    """
+    Runs component checks in the background, each on its own jittered
+    schedule, and serves the last known results. Readers never trigger a
+    probe, so health endpoints cost a dict lookup no matter how often they
+    are polled. A result older than STALE_AFTER_INTERVALS intervals counts
+    as unhealthy.
+    """
+
+    def __init__(self, jitter: float = DEFAULT_JITTER):
+        self.jitter = jitter
+        self._probes: Dict[str, _Probe] = {}
+
+    def register(self, name: str, check: Callable[[], Awaitable[Any]],
+                 interval: float = DEFAULT_INTERVAL, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self._probes[name] = _Probe(name, check, interval, timeout, ProbeResult())
+
+    def start(self) -> None:
+        for probe in self._probes.values():
+            if probe.task is None or probe.task.done():
+                probe.task = asyncio.create_task(self._run(probe))
+
+    async def stop(self) -> None:
+        tasks: List[asyncio.Task] = [p.task for p in self._probes.values() if p.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for probe in self._probes.values():
+            probe.task = None
+
+    async def probe_all(self) -> None:
+        """Probe every component once, concurrently; bounded by the longest timeout."""
+        await asyncio.gather(*(self.probe(name) for name in self._probes))
+
+    async def probe(self, name: str) -> ProbeResult:
+        probe = self._probes[name]
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(probe.check(), timeout=probe.timeout)
+            healthy, info = True, "ok"
+        except asyncio.TimeoutError:
+            healthy, info = False, "timeout"
+        except ProbeFailed as e:
+            healthy, info = False, str(e) or "error"
+        except Exception:
+            logger.exception("%s health probe failed", name)
+            healthy, info = False, "error"
+        finished = time.monotonic()
+        if probe.result.healthy is not False and not healthy:
+            logger.warning("%s became unhealthy: %s", name, info)
+        probe.result = ProbeResult(healthy, info, time.time(), finished, round(finished - started, 4))
+        return probe.result
+
+    async def _run(self, probe: _Probe) -> None:
+        if probe.result.checked_monotonic is None:
+            # Spread the first probes too, so replicas started together do not probe in lockstep.
+            await asyncio.sleep(random.uniform(0, probe.interval * self.jitter))
+        else:
+            # Already probed by probe_all() at startup.
+            await asyncio.sleep(probe.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+        while True:
+            await self.probe(probe.name)
+            await asyncio.sleep(probe.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        components = {}
+        for name, probe in self._probes.items():
+            result = probe.result
+            age = None if result.checked_monotonic is None else round(now - result.checked_monotonic, 3)
+            stale = age is None or age > probe.interval * STALE_AFTER_INTERVALS
+            components[name] = {
+                "healthy": bool(result.healthy) and not stale,
+                "info": "stale" if result.healthy and stale else result.info,
+                "checked_at": result.checked_at,
+                "age_seconds": age,
+                "duration_seconds": result.duration,
+            }
+        return components
+
+    def healthy(self) -> bool:
+        return all(component["healthy"] for component in self.snapshot().values())
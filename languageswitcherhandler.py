@@ -9,20 +9,51 @@ from database import async_session
 from models.user import User
 from core.redis import redis_client
 from settings import DEFAULT_LANGUAGE, SUPPORTED_LANGUAGES
+from localcache import LocalTTLCache, InvalidationListener
+from metrics import CACHE_LOOKUPS
+from statsstore import record_counter
+from usercontextmiddleware import invalidate_user_context
 
 logger = logging.getLogger(__name__)
 
 LANGUAGE_CACHE_TTL = 86400  # seconds
+# Bounds staleness if an invalidation message is lost while the listener reconnects.
+LOCAL_LANGUAGE_CACHE_TTL = 300  # seconds
+LOCAL_LANGUAGE_CACHE_SIZE = 50000
+LANGUAGE_INVALIDATION_CHANNEL = "cache:invalidate:user_lang"
 
 language_cb = CallbackData("lang_switch", "lang_code")
 
+_local_languages = LocalTTLCache(maxsize=LOCAL_LANGUAGE_CACHE_SIZE, ttl=LOCAL_LANGUAGE_CACHE_TTL)
+
+def _invalidate_local_language(payload: str) -> None:
+    try:
+        _local_languages.delete(int(payload))
+    except (TypeError, ValueError):
+        logger.warning("Ignoring malformed language invalidation message: %r", payload)
+
+language_invalidation_listener = InvalidationListener(
+    redis_client, LANGUAGE_INVALIDATION_CHANNEL, _invalidate_local_language
+)
+
 async def get_user_language(user_id: int) -> str:
+    # Started lazily so it runs on the dispatcher's event loop.
+    language_invalidation_listener.start()
+    lang = _local_languages.get(user_id)
+    if lang is not None:
+        CACHE_LOOKUPS.labels("user_language", "local", "hit").inc()
+        return lang
+    CACHE_LOOKUPS.labels("user_language", "local", "miss").inc()
     key = f"user:{user_id}:lang"
     # Try fetching from cache
     try:
         cached = await redis_client.get(key)
         if cached:
-            return cached.decode("utf-8")
+            CACHE_LOOKUPS.labels("user_language", "redis", "hit").inc()
+            lang = cached.decode("utf-8")
+            _local_languages.set(user_id, lang)
+            return lang
+        CACHE_LOOKUPS.labels("user_language", "redis", "miss").inc()
     except Exception as e:
         logger.warning("Redis get error for user %s: %s", user_id, e)
     # Fetch from database
@@ -44,6 +75,9 @@ async def get_user_language(user_id: int) -> str:
                 session.add(user)
                 try:
                     await session.commit()
+                    await record_counter("users", 1)
+                    # Replaces a cached "unknown user" context entry.
+                    await invalidate_user_context(user_id, redis_client)
                 except IntegrityError:
                     await session.rollback()
                     # Race condition: fetch the user inserted by another process
@@ -54,6 +88,7 @@ async def get_user_language(user_id: int) -> str:
                 await redis_client.set(key, lang, ex=LANGUAGE_CACHE_TTL)
             except Exception as e:
                 logger.warning("Redis set error for user %s: %s", user_id, e)
+            _local_languages.set(user_id, lang)
             return lang
     except SQLAlchemyError as e:
         logger.exception("DB error fetching language for user %s: %s", user_id, e)
@@ -68,18 +103,24 @@ async def set_user_language(user_id: int, lang: str) -> None:
         async with async_session() as session:
             result = await session.execute(select(User).filter_by(telegram_id=user_id))
             user = result.scalars().first()
+            created = user is None
             if user:
                 user.language = lang
             else:
                 user = User(telegram_id=user_id, language=lang)
                 session.add(user)
             await session.commit()
+        if created:
+            await record_counter("users", 1)
+            await invalidate_user_context(user_id, redis_client)
     except SQLAlchemyError as e:
         logger.exception("DB error setting language for user %s: %s", user_id, e)
         raise
     # Update cache
+    _local_languages.delete(user_id)
     try:
         await redis_client.set(key, lang, ex=LANGUAGE_CACHE_TTL)
+        await redis_client.publish(LANGUAGE_INVALIDATION_CHANNEL, str(user_id))
     except Exception as e:
         logger.warning("Redis set error for user %s: %s", user_id, e)
 
@@ -1,52 +1,202 @@
+import asyncio
+import json
 import logging
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 from aiogram.types import Message, ContentType
 from loader import dp, _
 from database import async_session
 from sqlalchemy import select, func, cast
 from geoalchemy2.types import Geography, Geometry
-from models import Route
+from models import Route, RoutePoint
+from core.redis import redis_client
+from localcache import InvalidationListener
+from routeevents import ROUTES_CHANGED_CHANNEL, ROUTES_VERSION_KEY
+from spatialindex import RouteSpatialIndex, bounding_box, geohash_encode, geohash_cell, nearest_point_m
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_RADIUS_KM = 10.0
 NEARBY_ROUTES_LIMIT = 10
 SUPPORTED_LANGUAGES = ("en", "ru", "be")
+INDEX_RETRY_SECONDS = 30
+NEARBY_CACHE_PRECISION = 6  # geohash cell of roughly 1.2 x 0.6 km
+NEARBY_CACHE_TTL = 3600  # seconds
+NEARBY_CACHE_FORMAT = 2  # bump when the cached candidate layout changes
+
+route_index = RouteSpatialIndex()
+_rebuild_task: Optional[asyncio.Task] = None
+_rebuild_requested = False
+_last_rebuild_failure = 0.0
+_routes_version: Optional[str] = None
+
+async def _load_route_index() -> None:
+    route_stmt = select(
+        Route.id,
+        Route.name_en,
+        Route.name_ru,
+        Route.name_be,
+        func.ST_Y(cast(Route.location, Geometry)).label("lat"),
+        func.ST_X(cast(Route.location, Geometry)).label("lon"),
+    )
+    points_stmt = select(RoutePoint.route_id, RoutePoint.latitude, RoutePoint.longitude)
+    async with async_session() as session:
+        route_rows = (await session.execute(route_stmt)).mappings().all()
+        point_rows = (await session.execute(points_stmt)).all()
+    routes = {row["id"]: dict(row) for row in route_rows}
+    points = [(row["id"], row["lat"], row["lon"]) for row in route_rows]
+    points.extend((route_id, lat, lon) for route_id, lat, lon in point_rows)
+    route_index.build(routes, points)
+    logger.info("Route spatial index built with %d routes and %d points", len(routes), len(points))
+
+async def _rebuild_loop() -> None:
+    global _rebuild_requested, _last_rebuild_failure
+    while _rebuild_requested:
+        _rebuild_requested = False
+        try:
+            await _load_route_index()
+        except Exception:
+            _last_rebuild_failure = time.monotonic()
+            logger.exception("Failed to build route spatial index")
+            return
+        if _rebuild_requested:
+            # The catalog changed while we were loading; keep serving from PostGIS.
+            route_index.invalidate()
+
+def schedule_route_index_rebuild(version: Optional[str] = None) -> None:
+    global _rebuild_task, _rebuild_requested, _routes_version
+    if version is not None:
+        # Cache keys embed the version, so bumping it retires every cached result.
+        _routes_version = version
+    # A change that lands mid-build triggers one more pass instead of serving stale data.
+    route_index.invalidate()
+    _rebuild_requested = True
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_rebuild_loop())
+
+routes_changed_listener = InvalidationListener(
+    redis_client, ROUTES_CHANGED_CHANNEL, schedule_route_index_rebuild
+)
 
 async def get_nearby_routes(
     lat: float,
     lon: float,
     radius_km: float = DEFAULT_RADIUS_KM,
-    limit: int = NEARBY_ROUTES_LIMIT
+    limit: int = NEARBY_ROUTES_LIMIT,
+    lang: str = "en"
 ) -> List[Dict[str, Any]]:
     radius_m = radius_km * 1000
-    distance_expr = func.ST_DistanceSphere(
-        cast(Route.location, Geography),
-        func.ST_MakePoint(lon, lat).cast(Geography)
-    ).label("distance")
-    stmt = (
-        select(
-            Route.id,
-            Route.name_en,
-            Route.name_ru,
-            Route.name_be,
-            func.ST_Y(cast(Route.location, Geometry)).label("lat"),
-            func.ST_X(cast(Route.location, Geometry)).label("lon"),
-            distance_expr
-        )
-        .where(
-            func.ST_DWithin(
-                cast(Route.location, Geography),
-                func.ST_MakePoint(lon, lat).cast(Geography),
-                radius_m
-            )
+    routes_changed_listener.start()
+    if route_index.ready:
+        return route_index.query(lat, lon, radius_m, limit)
+    idle = _rebuild_task is None or _rebuild_task.done()
+    if idle and time.monotonic() - _last_rebuild_failure > INDEX_RETRY_SECONDS:
+        schedule_route_index_rebuild()
+    return await _get_nearby_routes_cached(lat, lon, radius_m, limit, lang)
+
+async def _nearby_cache_key(cell: str, radius_m: float, lang: str) -> Optional[str]:
+    global _routes_version
+    if _routes_version is None:
+        try:
+            version = await redis_client.get(ROUTES_VERSION_KEY)
+            _routes_version = version.decode("utf-8") if version else "0"
+        except Exception as e:
+            logger.warning("Redis get error for routes version: %s", e)
+            return None
+    return f"nearby:{NEARBY_CACHE_FORMAT}:v{_routes_version}:{cell}:{int(radius_m)}:{lang}"
+
+async def _get_nearby_routes_cached(
+    lat: float,
+    lon: float,
+    radius_m: float,
+    limit: int,
+    lang: str
+) -> List[Dict[str, Any]]:
+    # Candidates are cached per geohash cell, searched from the cell center with the
+    # radius widened by the center-to-corner distance, so they cover every position
+    # in the cell and can be re-ranked exactly for the caller's coordinates.
+    cell = geohash_encode(lat, lon, NEARBY_CACHE_PRECISION)
+    key = await _nearby_cache_key(cell, radius_m, lang)
+    candidates = None
+    if key is not None:
+        try:
+            cached = await redis_client.get(key)
+            if cached:
+                candidates = json.loads(cached)
+        except Exception as e:
+            logger.warning("Redis get error for nearby routes %s: %s", key, e)
+    if candidates is None:
+        center_lat, center_lon, half_diagonal_m = geohash_cell(cell)
+        routes = await _query_nearby_routes_postgis(center_lat, center_lon, radius_m + half_diagonal_m)
+        candidates = [
+            {
+                "id": route["id"],
+                f"name_{lang}": route.get(f"name_{lang}"),
+                "name_en": route["name_en"],
+                "lat": route["lat"],
+                "lon": route["lon"],
+                "points": route["points"],
+            }
+            for route in routes
+        ]
+        if key is not None:
+            try:
+                await redis_client.set(key, json.dumps(candidates, ensure_ascii=False), ex=NEARBY_CACHE_TTL)
+            except Exception as e:
+                logger.warning("Redis set error for nearby routes %s: %s", key, e)
+    results = []
+    for candidate in candidates:
+        # Same definition as RouteSpatialIndex: distance to the nearest start point or waypoint.
+        distance = nearest_point_m(lat, lon, candidate["points"])
+        if distance <= radius_m:
+            route = {k: v for k, v in candidate.items() if k != "points"}
+            results.append(dict(route, distance=distance))
+    results.sort(key=lambda route: route["distance"])
+    return results[:limit]
+
+async def _query_nearby_routes_postgis(
+    lat: float,
+    lon: float,
+    radius_m: float
+) -> List[Dict[str, Any]]:
+    """
+    Routes whose start point or any waypoint lies within `radius_m`, each
+    with those points under "points" as [lat, lon] pairs. Waypoints are
+    prefiltered by bounding box and checked exactly by the caller.
+    """
+    route_columns = (
+        Route.id,
+        Route.name_en,
+        Route.name_ru,
+        Route.name_be,
+        func.ST_Y(cast(Route.location, Geometry)).label("lat"),
+        func.ST_X(cast(Route.location, Geometry)).label("lon"),
+    )
+    starts_stmt = select(*route_columns).where(
+        func.ST_DWithin(
+            cast(Route.location, Geography),
+            func.ST_MakePoint(lon, lat).cast(Geography),
+            radius_m
         )
-        .order_by(distance_expr)
-        .limit(limit)
+    )
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+    waypoints_stmt = select(RoutePoint.route_id, RoutePoint.latitude, RoutePoint.longitude).where(
+        RoutePoint.latitude.between(min_lat, max_lat),
+        RoutePoint.longitude.between(min_lon, max_lon),
     )
     async with async_session() as session:
-        result = await session.execute(stmt)
-        return result.mappings().all()
+        routes = {row["id"]: dict(row) for row in (await session.execute(starts_stmt)).mappings().all()}
+        waypoints = (await session.execute(waypoints_stmt)).all()
+        missing = {route_id for route_id, _, _ in waypoints} - routes.keys()
+        if missing:
+            extra_stmt = select(*route_columns).where(Route.id.in_(missing))
+            routes.update((row["id"], dict(row)) for row in (await session.execute(extra_stmt)).mappings().all())
+    for route in routes.values():
+        route["points"] = [] if route["lat"] is None else [[route["lat"], route["lon"]]]
+    for route_id, p_lat, p_lon in waypoints:
+        if route_id in routes:
+            routes[route_id]["points"].append([p_lat, p_lon])
+    return list(routes.values())
 
 @dp.message_handler(content_types=[ContentType.LOCATION])
 async def handle_location(message: Message):
@@ -58,7 +208,7 @@ async def handle_location(message: Message):
         primary_lang = "en"
     lang = primary_lang
     try:
-        routes = await get_nearby_routes(lat, lon)
+        routes = await get_nearby_routes(lat, lon, lang=lang)
     except Exception:
         logger.exception("Error fetching nearby routes")
         await message.answer(_("An error occurred while fetching routes."))
@@ -6,15 +6,25 @@ from pathlib import Path
 import asyncio
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import aioredis
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response, status
 import uvicorn
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import Update
+
+from database import (
+    async_database_url, dispose_db, get_engine, get_sessionmaker,
+    init_db as init_shared_db, pool_options_from_config,
+)
+from metrics import instrument_bot, instrument_dispatcher, instrument_redis
+from outboundscheduler import OutboundScheduler
+from querydiagnostics import QueryScopeMiddleware, query_scope
+from updatepipeline import UpdatePipeline, DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS
+from updatestreams import UpdateStreamPublisher, DEFAULT_SHARDS
 
 from app.api.routes import router as api_router
 from app.bot.handlers import register_handlers
@@ -50,31 +60,40 @@ def init_logging(path: str):
         logging.basicConfig(level=logging.INFO)
     logging.getLogger(__name__).info("Logging initialized")
 
-def init_db(db_url: str, echo: bool = False):
-    engine = create_async_engine(db_url, echo=echo, future=True)
-    SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-    return engine, SessionLocal
+def init_db(config: ConfigParser):
+    init_shared_db(
+        async_database_url(config.get("database", "url")),
+        echo=config.getboolean("database", "echo", fallback=False),
+        **pool_options_from_config(config, application_name="api"),
+    )
+    return get_engine(), get_sessionmaker()
 
 def init_cache(redis_url: str):
     return aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
 
+def get_allowed_updates(config: ConfigParser):
+    raw = config.get("telegram", "allowed_updates", fallback="")
+    return [item.strip() for item in raw.split(",") if item.strip()] or None
+
 def create_app(config: ConfigParser, engine, SessionLocal, redis_pool):
-    async def get_db() -> AsyncGenerator[AsyncSession, None]:
-        async with SessionLocal() as session:
-            try:
-                yield session
-                await session.commit()
-            except:
-                await session.rollback()
-                raise
+    async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+        route = request.scope.get("route")
+        with query_scope(f"api:{getattr(route, 'path', 'unmatched')}"):
+            async with SessionLocal() as session:
+                try:
+                    yield session
+                    await session.commit()
+                except:
+                    await session.rollback()
+                    raise
 
     app = FastAPI(
         title="Belarus Tourism Bot API",
         version=config.get("app", "version", fallback="1.0.0"),
-        dependencies=[Depends(get_db)],
     )
 
-    app.include_router(api_router, prefix="/api")
+    # Only the API needs a session; the Telegram webhook must ack without touching the database.
+    app.include_router(api_router, prefix="/api", dependencies=[Depends(get_db)])
 
     app.state.config = config
     app.state.db_engine = engine
@@ -86,9 +105,67 @@ def create_app(config: ConfigParser, engine, SessionLocal, redis_pool):
     bot = Bot(token=bot_token)
     dp = Dispatcher(storage=storage)
     register_handlers(dp)
+    instrument_dispatcher(dp)
+    dp.update.outer_middleware(QueryScopeMiddleware())
+    instrument_bot(bot)
+    instrument_redis(redis_pool)
+    # Replies sent from this process share the bot-wide send budget. The API
+    # also drains the outbound queue Celery fills, unless OUTBOUND_ENABLED is
+    # off (same setting as bot.py); several consumers can run side by side.
+    outbound = OutboundScheduler(redis_pool, bot)
+    outbound.install(bot)
+    outbound_enabled = os.getenv("OUTBOUND_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+    app.state.outbound = outbound
+
+    use_webhook = config.getboolean("telegram", "use_webhook", fallback=False)
+    webhook_path = config.get("telegram", "webhook_path", fallback="/webhook")
+    webhook_secret = config.get("telegram", "webhook_secret", fallback="") or None
+    drop_pending_updates = config.getboolean("telegram", "drop_pending_updates", fallback=False)
+    allowed_updates = get_allowed_updates(config)
+
+    pipeline = UpdatePipeline(
+        bot,
+        dp,
+        queue_size=config.getint("telegram", "update_queue_size", fallback=DEFAULT_QUEUE_SIZE),
+        workers=config.getint("telegram", "update_workers", fallback=DEFAULT_WORKERS),
+    )
+    app.state.update_pipeline = pipeline
+
+    publisher = None
+    if config.get("telegram", "ingress_mode", fallback="local") == "streams":
+        publisher = UpdateStreamPublisher(
+            redis_pool,
+            shards=config.getint("telegram", "update_stream_shards", fallback=DEFAULT_SHARDS),
+        )
+    app.state.update_publisher = publisher
+
+    if use_webhook:
+        @app.post(webhook_path, include_in_schema=False)
+        async def telegram_webhook(request: Request):
+            if webhook_secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != webhook_secret:
+                return Response(status_code=status.HTTP_401_UNAUTHORIZED)
+            try:
+                data = await request.json()
+                update = Update.model_validate(data, context={"bot": bot})
+            except Exception:
+                logging.getLogger(__name__).warning("Malformed webhook update received")
+                return Response(status_code=status.HTTP_200_OK)
+            if publisher is not None:
+                try:
+                    await publisher.publish(data)
+                except Exception:
+                    logging.getLogger(__name__).exception("Failed to publish update %s", update.update_id)
+                    return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+                return Response(status_code=status.HTTP_200_OK)
+            if not pipeline.submit(update):
+                # Telegram redelivers updates that were not acknowledged with 2xx.
+                return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return Response(status_code=status.HTTP_200_OK)
 
     @app.on_event("startup")
     async def on_startup():
+        if outbound_enabled:
+            outbound.start()
         async with engine.begin():
             pass
         default_commands = [
@@ -96,12 +173,29 @@ def create_app(config: ConfigParser, engine, SessionLocal, redis_pool):
             {"command": "help", "description": "Get help"},
         ]
         await bot.set_my_commands(default_commands)
-        app.state.bot_polling_task = asyncio.create_task(
-            dp.start_polling(bot, skip_updates=True)
-        )
+        if use_webhook:
+            if publisher is None:
+                await pipeline.start()
+            webhook_url = config.get("telegram", "webhook_url").rstrip("/") + webhook_path
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=webhook_secret,
+                allowed_updates=allowed_updates,
+                drop_pending_updates=drop_pending_updates,
+                max_connections=config.getint("telegram", "webhook_max_connections", fallback=40),
+            )
+        else:
+            await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+            if publisher is not None:
+                polling = publisher.run_polling(bot, allowed_updates=allowed_updates)
+            else:
+                polling = dp.start_polling(bot, allowed_updates=allowed_updates, handle_signals=False)
+            app.state.bot_polling_task = asyncio.create_task(polling)
 
     @app.on_event("shutdown")
     async def on_shutdown():
+        await pipeline.stop()
+        await outbound.stop()
         polling_task = getattr(app.state, "bot_polling_task", None)
         if polling_task:
             polling_task.cancel()
@@ -117,7 +211,7 @@ def create_app(config: ConfigParser, engine, SessionLocal, redis_pool):
             await redis_pool.wait_closed()
         except Exception:
             pass
-        await engine.dispose()
+        await dispose_db()
 
     return app
 
@@ -131,9 +225,7 @@ def main():
     except ValueError as e:
         logging.error(str(e))
         raise
-    db_url = config.get("database", "url")
-    db_echo = config.getboolean("database", "echo", fallback=False)
-    engine, SessionLocal = init_db(db_url, db_echo)
+    engine, SessionLocal = init_db(config)
     redis_url = config.get("redis", "url")
     redis_pool = init_cache(redis_url)
     app = create_app(config, engine, SessionLocal, redis_pool)
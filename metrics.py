@@ -0,0 +1,256 @@
+import functools
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Set
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+UPDATES = Counter("bot_updates_total", "Telegram updates received", ["type"])
+UPDATES_IN_FLIGHT = Gauge("bot_updates_in_flight", "Telegram updates being processed")
+UPDATE_DURATION = Histogram("bot_update_duration_seconds", "Time to process one update", ["type"])
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Time spent in an aiogram handler", ["handler", "status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ["engine", "operation", "fingerprint"]
+)
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Connections in the SQLAlchemy pool", ["engine", "state"])
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured SQLAlchemy pool size", ["engine"])
+REDIS_COMMAND_DURATION = Histogram("redis_command_duration_seconds", "Redis command latency", ["command"])
+REDIS_ERRORS = Counter("redis_command_errors_total", "Failed Redis commands", ["command"])
+TELEGRAM_REQUEST_DURATION = Histogram(
+    "telegram_request_duration_seconds", "Telegram Bot API request latency", ["method"]
+)
+TELEGRAM_ERRORS = Counter("telegram_request_errors_total", "Failed Telegram Bot API requests", ["method", "error"])
+TELEGRAM_RETRY_AFTER = Counter(
+    "telegram_retry_after_total", "Telegram Bot API 429 responses", ["method"]
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache layer", ["cache", "layer", "result"])
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+")
+# Casts asyncpg adds to bind parameters, e.g. ::INTEGER, ::VARCHAR(255), ::TIMESTAMP WITH TIME ZONE.
+_CAST_RE = re.compile(
+    r"::[A-Za-z_]\w*(?:\s+(?:PRECISION|VARYING|WITH(?:OUT)?\s+TIME\s+ZONE))?(?:\s*\([\d\s,]*\))?(?:\[\])*",
+    re.IGNORECASE,
+)
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+# Consecutive rows of a multi-row VALUES clause, once their parameters are collapsed.
+_VALUES_ROWS_RE = re.compile(r"\(\?(?:\.\.\.)?\)(?:\s*,\s*\(\?(?:\.\.\.)?\))+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_seen_fingerprints: Dict[str, str] = {}
+MAX_LOGGED_FINGERPRINTS = 1000
+# Distinct fingerprint label values per process; later shapes are exported as "other".
+MAX_FINGERPRINT_LABELS = 500
+OTHER_FINGERPRINT = "other"
+_label_fingerprints: Set[str] = set()
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Replace literals and bind parameters with `?`, drop casts and collapse
+    IN lists, multi-row VALUES and whitespace, so list lengths and batch
+    sizes do not create new shapes.
+    """
+    statement = _STRING_RE.sub("?", statement)
+    statement = _PARAM_RE.sub("?", statement)
+    statement = _CAST_RE.sub("", statement)
+    statement = _NUMBER_RE.sub("?", statement)
+    statement = _IN_LIST_RE.sub("(?...)", statement)
+    statement = _VALUES_ROWS_RE.sub("(?...), ...", statement)
+    return _WHITESPACE_RE.sub(" ", statement).strip()
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_fingerprint(statement: str) -> str:
+    """Short stable id of a statement's shape, used as a low-cardinality metric label."""
+    normalized = normalize_statement(statement)
+    fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    if fingerprint not in _seen_fingerprints and len(_seen_fingerprints) < MAX_LOGGED_FINGERPRINTS:
+        _seen_fingerprints[fingerprint] = normalized
+        logger.debug("SQL fingerprint %s: %s", fingerprint, normalized)
+    return fingerprint
+
+
+def fingerprint_label(fingerprint: str) -> str:
+    """`fingerprint` as a metric label, capped at MAX_FINGERPRINT_LABELS values."""
+    if fingerprint in _label_fingerprints:
+        return fingerprint
+    if len(_label_fingerprints) >= MAX_FINGERPRINT_LABELS:
+        return OTHER_FINGERPRINT
+    _label_fingerprints.add(fingerprint)
+    return fingerprint
+
+
+def describe_fingerprint(fingerprint: str) -> str:
+    return _seen_fingerprints.get(fingerprint, "")
+
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else ""
+
+
+# Called with (statement, parameters, elapsed seconds, fingerprint) after each statement.
+QueryObserver = Callable[[str, Any, float, str], None]
+
+
+def instrument_engine(engine, name: str = "default", observers: Iterable[QueryObserver] = ()) -> None:
+    """
+    Time every cursor execution and export pool utilisation for an (async)
+    engine. `observers` reuse the same timing and fingerprint instead of
+    registering listeners of their own.
+    """
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    observers = tuple(observers)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        fingerprint = statement_fingerprint(statement)
+        DB_QUERY_DURATION.labels(name, _operation(statement), fingerprint_label(fingerprint)).observe(elapsed)
+        for observer in observers:
+            observer(statement, parameters, elapsed, fingerprint)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_SIZE.labels(name).set(pool.size())
+        DB_POOL_CONNECTIONS.labels(name, "checked_out").set_function(pool.checkedout)
+        DB_POOL_CONNECTIONS.labels(name, "idle").set_function(pool.checkedin)
+        DB_POOL_CONNECTIONS.labels(name, "overflow").set_function(lambda: max(pool.overflow(), 0))
+
+
+def instrument_redis(client) -> None:
+    """Time every command sent through `client` (pipelines are timed as one PIPELINE command)."""
+    if getattr(client, "_metrics_instrumented", False):
+        return
+    execute_command = client.execute_command
+
+    async def timed_execute_command(*args, **options):
+        command = str(args[0]).upper() if args else "UNKNOWN"
+        started = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        except Exception:
+            REDIS_ERRORS.labels(command).inc()
+            raise
+        finally:
+            REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - started)
+
+    pipeline = client.pipeline
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def timed_execute(*exec_args, **exec_kwargs):
+            started = time.perf_counter()
+            try:
+                return await execute(*exec_args, **exec_kwargs)
+            except Exception:
+                REDIS_ERRORS.labels("PIPELINE").inc()
+                raise
+            finally:
+                REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - started)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    client._metrics_instrumented = True
+
+
+class UpdateMetricsMiddleware:
+    """Outer update middleware: counts updates by type and tracks in-flight work."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = getattr(event, "event_type", None) or "unknown"
+        UPDATES.labels(update_type).inc()
+        UPDATES_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            UPDATE_DURATION.labels(update_type).observe(time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware:
+    """Inner middleware: latency of the matched handler, labelled by its callback name."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__qualname__", None) or getattr(callback, "__name__", None) or "unknown"
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            HANDLER_DURATION.labels(name, status).observe(time.perf_counter() - started)
+
+
+def instrument_dispatcher(dp) -> None:
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_metrics = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(handler_metrics)
+
+
+def instrument_bot(bot) -> None:
+    """Record Bot API latency, errors and 429s through an aiogram session middleware."""
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    from aiogram.exceptions import TelegramRetryAfter
+
+    class TelegramRequestMetrics(BaseRequestMiddleware):
+        async def __call__(self, make_request, bot, method):
+            method_name = type(method).__name__
+            started = time.perf_counter()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter:
+                TELEGRAM_RETRY_AFTER.labels(method_name).inc()
+                TELEGRAM_ERRORS.labels(method_name, "TelegramRetryAfter").inc()
+                raise
+            except Exception as e:
+                TELEGRAM_ERRORS.labels(method_name, type(e).__name__).inc()
+                raise
+            finally:
+                TELEGRAM_REQUEST_DURATION.labels(method_name).observe(time.perf_counter() - started)
+
+    bot.session.middleware(TelegramRequestMetrics())
@@ -48,13 +48,19 @@ class Chat(Base):
 class TourRoute(Base):
     __tablename__ = 'tour_routes'
     id = Column(Integer, primary_key=True)
+    slug = Column(String(255), index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text)
     language_code = Column(String(10), ForeignKey('languages.code'), nullable=False)
     published = Column(Boolean, default=False, nullable=False)
+    details = Column(JSONB, default=dict)
     created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
 
+    __table_args__ = (
+        UniqueConstraint('slug', 'language_code', name='uix_tour_route_slug_language'),
+    )
+
     language = relationship('Language', back_populates='tour_routes')
     points = relationship('RoutePoint', back_populates='route', cascade='all, delete-orphan')
 
@@ -0,0 +1,586 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from localcache import LocalTTLCache
+from ratelimiter import CompositeRateLimiter
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_PREFIX = "outbound"
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BROADCAST = "broadcast"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BROADCAST)
+ALLOWED_METHODS = frozenset({"send_message", "send_photo", "send_document", "send_audio", "copy_message"})
+TEMPLATE_METHOD = "template"
+# Parameter holding the uploadable media for each method, and how to read its file_id back.
+MEDIA_FIELDS = {"send_photo": "photo", "send_document": "document", "send_audio": "audio"}
+MEDIA_FILE_ID_TTL = 30 * 86400  # seconds
+
+DEFAULT_GLOBAL_RATE = 30  # messages per second for the whole bot
+DEFAULT_PER_CHAT_RATE = 1  # messages per second for one chat
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_ENQUEUE_BATCH = 500
+DEFAULT_CONCURRENCY = 8  # sends in flight per process
+JOB_TTL = 2 * 86400  # seconds; delivery tracking outlives any Celery retry
+POP_TIMEOUT = 0.2  # seconds; also the longest an enqueued interactive entry waits behind an idle broadcast pop
+PROMOTE_INTERVAL = 0.5  # seconds
+RECOVER_INTERVAL = 5  # seconds
+VISIBILITY_TIMEOUT = 60  # seconds an entry may sit in the processing list before it is requeued
+# Bot API methods that count against Telegram's message limits.
+RATE_LIMITED_METHODS = frozenset({
+    "SendMessage", "SendPhoto", "SendDocument", "SendAudio", "SendVideo", "SendAnimation", "SendVoice",
+    "SendVideoNote", "SendSticker", "SendLocation", "SendVenue", "SendContact", "SendPoll", "SendDice",
+    "SendMediaGroup", "CopyMessage", "ForwardMessage",
+})
+
+SENT = Counter("outbound_messages_sent_total", "Outbound Telegram messages delivered", ["priority"])
+FAILED = Counter("outbound_messages_failed_total", "Outbound Telegram messages dropped", ["reason"])
+RETRY_AFTER = Counter("outbound_retry_after_total", "Telegram 429 responses received by the outbound scheduler")
+
+# Records each message identity in the job's queued set and pushes the entry
+# only if the identity is new, in one step, so a failed push never leaves a
+# message marked as queued. KEYS: queued set, queue. ARGV: ttl, then
+# (identity, entry) pairs.
+LUA_ENQUEUE_NEW = """
+local added = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[2], ARGV[i + 1])
+        added = added + 1
+    end
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+return added
+"""
+
+# Moves due entries from the delayed set back to the head of their queue.
+# KEYS: delayed set, interactive queue, broadcast queue.
+LUA_PROMOTE_DUE = """
+local queues = {interactive = KEYS[2], broadcast = KEYS[3]}
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, entry in ipairs(due) do
+    redis.call('ZREM', KEYS[1], entry)
+    redis.call('LPUSH', queues[cjson.decode(entry)['priority']], entry)
+end
+return #due
+"""
+
+# Requeues entries that have been in the processing list longer than the
+# visibility timeout, i.e. whose consumer died mid-send. An entry's age is
+# counted from the first recovery pass that sees it.
+# KEYS: processing list, first-seen set, interactive queue, broadcast queue.
+LUA_RECOVER_STALE = """
+local queues = {interactive = KEYS[3], broadcast = KEYS[4]}
+local now = tonumber(ARGV[1])
+local stale_before = now - tonumber(ARGV[2])
+local requeued = 0
+local listed = {}
+for _, entry in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    listed[entry] = true
+    local seen = tonumber(redis.call('ZSCORE', KEYS[2], entry))
+    if not seen then
+        redis.call('ZADD', KEYS[2], now, entry)
+    elseif seen < stale_before then
+        redis.call('LREM', KEYS[1], 1, entry)
+        redis.call('ZREM', KEYS[2], entry)
+        redis.call('LPUSH', queues[cjson.decode(entry)['priority']], entry)
+        requeued = requeued + 1
+    end
+end
+for _, entry in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    if not listed[entry] then
+        redis.call('ZREM', KEYS[2], entry)
+    end
+end
+return requeued
+"""
+
+# Set while the scheduler itself calls the Bot API, so OutboundRequestMiddleware
+# does not charge those sends a second time.
+_scheduled_send: contextvars.ContextVar[bool] = contextvars.ContextVar("outbound_scheduled_send", default=False)
+
+
+def queue_key(priority: str, prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:q:{priority}"
+
+
+def delayed_key(prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:delayed"
+
+
+def pause_key(prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:paused"
+
+
+def job_key(job_id: str, state: str, prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:job:{job_id}:{state}"
+
+
+def template_key(job_id: str, name: str, prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:tpl:{job_id}:{name}"
+
+
+def media_key(name: str, prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:media:{name}"
+
+
+def processing_key(prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:processing"
+
+
+def processing_seen_key(prefix: str = OUTBOUND_PREFIX) -> str:
+    return f"{prefix}:processing:seen"
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if hasattr(value, "dict"):
+        return value.dict(exclude_none=True)
+    return value
+
+
+def message_identity(chat_id: int, method: str, params: Dict[str, Any], dedup_key: Optional[str] = None) -> str:
+    """
+    Identity of one message within a job: the chat plus the caller's own id
+    for it (e.g. a notification id) or, without one, a hash of the method
+    and parameters. Two different messages to one chat never collide.
+    """
+    if dedup_key is None:
+        body = json.dumps([method, {k: _jsonable(v) for k, v in params.items()}],
+                          sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        dedup_key = hashlib.sha1(body.encode("utf-8")).hexdigest()
+    return f"{chat_id}:{dedup_key}"
+
+
+def build_entry(chat_id: int, method: str, params: Dict[str, Any], priority: str,
+                job_id: Optional[str] = None, identity: Optional[str] = None) -> str:
+    if method not in ALLOWED_METHODS and method != TEMPLATE_METHOD:
+        raise ValueError(f"Unsupported outbound method: {method}")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown outbound priority: {priority}")
+    return json.dumps({
+        "id": uuid.uuid4().hex,
+        "job": job_id,
+        "message": identity,
+        "chat_id": chat_id,
+        "method": method,
+        "params": {key: _jsonable(value) for key, value in params.items()},
+        "priority": priority,
+        "attempts": 0,
+    }, separators=(",", ":"), ensure_ascii=False)
+
+
+class OutboundQueue:
+    """
+    Synchronous producer used by Celery tasks.
+
+    Messages are recorded per job in `outbound:job:{id}:queued` by their
+    message_identity, so running the same job again (e.g. after a Celery
+    retry) only enqueues messages that were not queued before, while a
+    second, different message to the same chat still goes out.
+    """
+
+    def __init__(self, redis_client, prefix: str = OUTBOUND_PREFIX):
+        self.redis = redis_client
+        self.prefix = prefix
+        self._enqueue_new = redis_client.register_script(LUA_ENQUEUE_NEW)
+
+    def enqueue_many(self, job_id: str, messages: Iterable[tuple],
+                     priority: str = PRIORITY_BROADCAST) -> int:
+        """
+        `messages` holds (chat_id, method, params) or
+        (chat_id, method, params, dedup_key) tuples.
+        """
+        args: List[Any] = [JOB_TTL]
+        for message in messages:
+            chat_id, method, params = message[:3]
+            identity = message_identity(chat_id, method, params, message[3] if len(message) > 3 else None)
+            args.extend((identity, build_entry(chat_id, method, params, priority, job_id, identity)))
+        if len(args) == 1:
+            return 0
+        return int(self._enqueue_new(
+            keys=[job_key(job_id, "queued", self.prefix), queue_key(priority, self.prefix)], args=args,
+        ))
+
+    def put_template(self, job_id: str, name: str, method: str, params: Dict[str, Any],
+                     media: Optional[str] = None) -> str:
+        """
+        Store a message rendered once for many recipients and return its key.
+        `media` names the uploaded file so its Telegram file_id is reused
+        after the first send.
+        """
+        if method not in ALLOWED_METHODS:
+            raise ValueError(f"Unsupported outbound method: {method}")
+        if media is not None and method not in MEDIA_FIELDS:
+            raise ValueError(f"Method {method} does not carry media")
+        key = template_key(job_id, name, self.prefix)
+        body = {"method": method, "params": {k: _jsonable(v) for k, v in params.items()}, "media": media}
+        self.redis.set(key, json.dumps(body, separators=(",", ":"), ensure_ascii=False), ex=JOB_TTL)
+        return key
+
+    def job(self, job_id: str, priority: str = PRIORITY_BROADCAST,
+            batch_size: int = DEFAULT_ENQUEUE_BATCH) -> "OutboundJob":
+        return OutboundJob(self, job_id, priority, batch_size)
+
+    def progress(self, job_id: str) -> Dict[str, int]:
+        pipe = self.redis.pipeline(transaction=False)
+        for state in ("queued", "delivered", "failed"):
+            pipe.scard(job_key(job_id, state, self.prefix))
+        queued, delivered, failed = pipe.execute()
+        return {"queued": queued, "delivered": delivered, "failed": failed}
+
+
+class OutboundJob:
+    """Buffers sends for one job and enqueues them in batches."""
+
+    def __init__(self, queue: OutboundQueue, job_id: str, priority: str = PRIORITY_BROADCAST,
+                 batch_size: int = DEFAULT_ENQUEUE_BATCH):
+        self.queue = queue
+        self.job_id = job_id
+        self.priority = priority
+        self.batch_size = batch_size
+        self.enqueued = 0
+        self._buffer: List[Tuple[int, str, Dict[str, Any], Optional[str]]] = []
+
+    def __enter__(self) -> "OutboundJob":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
+
+    def send(self, chat_id: int, method: str, dedup_key: Optional[str] = None, **params: Any) -> None:
+        """
+        Queue one message. Pass `dedup_key` (e.g. a notification id) when
+        the same content may legitimately be sent twice in one job.
+        """
+        self._buffer.append((chat_id, method, params, dedup_key))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def send_message(self, chat_id: int, text: str, dedup_key: Optional[str] = None, **params: Any) -> None:
+        self.send(chat_id, "send_message", dedup_key, text=text, **params)
+
+    def send_photo(self, chat_id: int, photo: str, dedup_key: Optional[str] = None, **params: Any) -> None:
+        self.send(chat_id, "send_photo", dedup_key, photo=photo, **params)
+
+    def send_template(self, chat_id: int, key: str) -> None:
+        self.send(chat_id, TEMPLATE_METHOD, key=key)
+
+    def flush(self) -> int:
+        buffer, self._buffer = self._buffer, []
+        added = self.queue.enqueue_many(self.job_id, buffer, self.priority)
+        self.enqueued += added
+        return added
+
+
+class OutboundScheduler:
+    """
+    Consumes the outbound queues inside the bot process and paces sends to
+    Telegram's limits: about `global_rate` messages per second overall and
+    `per_chat_rate` per chat, shared across processes through Redis.
+
+    Up to `concurrency` sends are in flight per process. Interactive entries
+    are always claimed before broadcasts, and direct Bot API sends made by
+    handlers are charged to the same global budget through
+    OutboundRequestMiddleware; while one of them waits for budget, no new
+    broadcast is claimed. A chat that is over its budget is parked in a
+    delayed set instead of blocking the queue, and a 429 pauses every
+    consumer for `retry_after` seconds.
+
+    Claimed entries are moved atomically into a processing list and only
+    removed once they are sent, parked or dropped, so a crash mid-send
+    requeues them after VISIBILITY_TIMEOUT. The Lua scripts receive every
+    key through KEYS; on Redis Cluster use a hash-tagged prefix such as
+    "{outbound}" so those keys share a slot.
+    """
+
+    def __init__(self, redis, bot, global_rate: int = DEFAULT_GLOBAL_RATE,
+                 per_chat_rate: int = DEFAULT_PER_CHAT_RATE, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 concurrency: int = DEFAULT_CONCURRENCY, prefix: str = OUTBOUND_PREFIX):
+        self.redis = redis
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.prefix = prefix
+        self.limiter = CompositeRateLimiter(
+            redis,
+            [("global", global_rate, 1), ("chat", per_chat_rate, 1)],
+            prefix=f"{prefix}:rl",
+        )
+        self._promote = redis.register_script(LUA_PROMOTE_DUE)
+        self._recover = redis.register_script(LUA_RECOVER_STALE)
+        self._queues = {priority: queue_key(priority, prefix) for priority in PRIORITIES}
+        self._processing = processing_key(prefix)
+        self._templates = LocalTTLCache(maxsize=256, ttl=300)
+        self._tasks: List[asyncio.Task] = []
+        self._sends: set = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = False
+        self._paused_until = 0.0
+        self._interactive_waiting = 0
+
+    async def enqueue(self, chat_id: int, method: str, params: Dict[str, Any],
+                      priority: str = PRIORITY_INTERACTIVE, job_id: Optional[str] = None) -> None:
+        await self.redis.rpush(queue_key(priority, self.prefix), build_entry(chat_id, method, params, priority, job_id))
+
+    def install(self, bot) -> None:
+        """Charge direct sends made through `bot` to the shared outbound budget."""
+        bot.session.middleware(OutboundRequestMiddleware(self))
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._running = True
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._tasks = [asyncio.create_task(self.run()), asyncio.create_task(self._maintain())]
+
+    async def stop(self) -> None:
+        self._running = False
+        tasks = self._tasks + list(self._sends)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._sends.clear()
+
+    async def run(self) -> None:
+        while self._running:
+            await self._slots.acquire()
+            try:
+                claimed = await self._claim()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            except Exception:
+                self._slots.release()
+                logger.exception("Outbound scheduler claim failed")
+                await asyncio.sleep(1)
+                continue
+            if claimed is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._handle(claimed))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _claim(self) -> Optional[str]:
+        await self._wait_for_pause()
+        raw = await self.redis.lmove(self._queues[PRIORITY_INTERACTIVE], self._processing, "LEFT", "RIGHT")
+        if raw is None:
+            if self._interactive_waiting:
+                # Leave the global budget to handler replies that are waiting for it.
+                await asyncio.sleep(0.05)
+                return None
+            raw = await self.redis.blmove(
+                self._queues[PRIORITY_BROADCAST], self._processing, POP_TIMEOUT, "LEFT", "RIGHT"
+            )
+        if raw is None:
+            return None
+        return raw.decode() if isinstance(raw, bytes) else raw
+
+    async def _handle(self, raw: str) -> None:
+        try:
+            entry = json.loads(raw)
+            await self._process(raw, self._queues[entry["priority"]], entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Left in the processing list; recovery requeues it after VISIBILITY_TIMEOUT.
+            logger.exception("Outbound send failed")
+        finally:
+            self._slots.release()
+
+    async def _maintain(self) -> None:
+        keys = [self._queues[PRIORITY_INTERACTIVE], self._queues[PRIORITY_BROADCAST]]
+        last_recovery = 0.0
+        while self._running:
+            try:
+                now = time.time()
+                await self._promote(keys=[delayed_key(self.prefix)] + keys, args=[int(now * 1000), 100])
+                if now - last_recovery >= RECOVER_INTERVAL:
+                    last_recovery = now
+                    requeued = await self._recover(
+                        keys=[self._processing, processing_seen_key(self.prefix)] + keys,
+                        args=[int(now), VISIBILITY_TIMEOUT],
+                    )
+                    if requeued:
+                        logger.warning("Requeued %s outbound entries abandoned mid-send", requeued)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbound scheduler maintenance failed")
+            await asyncio.sleep(PROMOTE_INTERVAL)
+
+    async def pause(self, seconds: float) -> None:
+        RETRY_AFTER.inc()
+        logger.warning("Telegram asked to retry after %ss", seconds)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        await self.redis.set(pause_key(self.prefix), 1, px=int(seconds * 1000))
+
+    async def _wait_for_local_pause(self) -> None:
+        remaining = self._paused_until - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    async def _wait_for_pause(self) -> None:
+        await self._wait_for_local_pause()
+        ttl_ms = await self.redis.pttl(pause_key(self.prefix))
+        if ttl_ms and ttl_ms > 0:
+            await asyncio.sleep(ttl_ms / 1000)
+
+    async def acquire_interactive(self) -> None:
+        """Wait for room in the global budget for a direct send made by a handler."""
+        self._interactive_waiting += 1
+        try:
+            while True:
+                await self._wait_for_pause()
+                result = await self.limiter.attempt({"global": "all"})
+                if result.allowed:
+                    return
+                await asyncio.sleep(result.retry_after)
+        except Exception as e:
+            # Never hold a reply back because Redis is unavailable.
+            logger.error("Outbound budget check failed, sending anyway: %s", e)
+        finally:
+            self._interactive_waiting -= 1
+
+    async def _ack(self, raw: str, pipe=None) -> None:
+        pipe = pipe if pipe is not None else self.redis.pipeline(transaction=True)
+        pipe.lrem(self._processing, 1, raw)
+        pipe.zrem(processing_seen_key(self.prefix), raw)
+        await pipe.execute()
+
+    async def _process(self, raw: str, source_key: str, entry: Dict[str, Any]) -> None:
+        while True:
+            result = await self.limiter.attempt({"global": "all", "chat": str(entry["chat_id"])})
+            if result.allowed:
+                break
+            if result.dimension == "chat":
+                await self._delay(raw, entry, result.retry_after)
+                return
+            await asyncio.sleep(result.retry_after)
+        # Claimed before a 429 from another send in this process.
+        await self._wait_for_local_pause()
+        await self._send(raw, source_key, entry)
+
+    async def _delay(self, raw: str, entry: Dict[str, Any], seconds: float) -> None:
+        due_ms = int((time.time() + seconds) * 1000)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(delayed_key(self.prefix), {json.dumps(entry, separators=(",", ":")): due_ms})
+        await self._ack(raw, pipe)
+
+    async def _load_template(self, key: str) -> Optional[Dict[str, Any]]:
+        template = self._templates.get(key)
+        if template is None:
+            raw = await self.redis.get(key)
+            if raw is None:
+                return None
+            template = json.loads(raw)
+            self._templates.set(key, template)
+        return template
+
+    async def _resolve(self, entry: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any], Optional[str]]:
+        if entry["method"] != TEMPLATE_METHOD:
+            return entry["method"], entry["params"], None
+        template = await self._load_template(entry["params"]["key"])
+        if template is None:
+            return None, {}, None
+        params = dict(template["params"])
+        media = template.get("media")
+        if media:
+            file_id = await self.redis.get(media_key(media, self.prefix))
+            if file_id:
+                params[MEDIA_FIELDS[template["method"]]] = file_id.decode() if isinstance(file_id, bytes) else file_id
+                media = None
+            else:
+                field = MEDIA_FIELDS[template["method"]]
+                if isinstance(params.get(field), str) and os.path.isfile(params[field]):
+                    from aiogram.types import FSInputFile
+                    params[field] = FSInputFile(params[field])
+        return template["method"], params, media
+
+    async def _remember_file_id(self, media: str, method: str, message) -> None:
+        attachment = getattr(message, MEDIA_FIELDS[method], None)
+        if isinstance(attachment, list):
+            attachment = attachment[-1] if attachment else None
+        if attachment is not None:
+            await self.redis.set(media_key(media, self.prefix), attachment.file_id, ex=MEDIA_FILE_ID_TTL)
+
+    async def _send(self, raw: str, source_key: str, entry: Dict[str, Any]) -> None:
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+        method_name, params, media = await self._resolve(entry)
+        if method_name is None:
+            await self._fail(raw, entry, "template_expired", KeyError(entry["params"]["key"]))
+            return
+        method = getattr(self.bot, method_name)
+        token = _scheduled_send.set(True)
+        try:
+            message = await method(chat_id=entry["chat_id"], **params)
+        except TelegramRetryAfter as e:
+            await self.pause(e.retry_after)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.lpush(source_key, raw)
+            await self._ack(raw, pipe)
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            await self._fail(raw, entry, type(e).__name__, e)
+            return
+        except Exception as e:
+            entry["attempts"] += 1
+            if entry["attempts"] >= self.max_attempts:
+                await self._fail(raw, entry, "attempts_exhausted", e)
+            else:
+                await self._delay(raw, entry, 2 ** entry["attempts"])
+            return
+        finally:
+            _scheduled_send.reset(token)
+        SENT.labels(entry["priority"]).inc()
+        if media:
+            await self._remember_file_id(media, method_name, message)
+        await self._finish(raw, entry, "delivered")
+
+    async def _fail(self, raw: str, entry: Dict[str, Any], reason: str, error: Exception) -> None:
+        FAILED.labels(reason).inc()
+        logger.warning("Dropping outbound %s to chat %s: %s", entry["method"], entry["chat_id"], error)
+        await self._finish(raw, entry, "failed")
+
+    async def _finish(self, raw: str, entry: Dict[str, Any], state: str) -> None:
+        pipe = self.redis.pipeline(transaction=True)
+        if entry["job"]:
+            key = job_key(entry["job"], state, self.prefix)
+            pipe.sadd(key, entry.get("message") or entry["chat_id"])
+            pipe.expire(key, JOB_TTL)
+        await self._ack(raw, pipe)
+
+
+class OutboundRequestMiddleware:
+    """
+    Bot session middleware that makes handlers' direct sends wait for the
+    scheduler's global budget, so replies and broadcasts together stay
+    under Telegram's limit, and that pauses the scheduler on a 429. Only the
+    global dimension is charged: replies to a user are not held back by the
+    per-chat pacing meant for broadcasts.
+    """
+
+    def __init__(self, scheduler: OutboundScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        if _scheduled_send.get() or type(method).__name__ not in RATE_LIMITED_METHODS:
+            return await make_request(bot, method)
+        from aiogram.exceptions import TelegramRetryAfter
+        await self.scheduler.acquire_interactive()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            await self.scheduler.pause(e.retry_after)
+            raise
@@ -0,0 +1,82 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+
+CURSOR_SECRET = os.getenv("CURSOR_SECRET") or os.getenv("SECRET_KEY", "your-secret-key")
+CURSOR_MAC_BYTES = 12
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(CURSOR_SECRET.encode("utf-8"), payload, hashlib.sha256).digest()[:CURSOR_MAC_BYTES]
+
+
+def encode_cursor(sort: str, value: Any, row_id: int) -> str:
+    if isinstance(value, datetime):
+        kind, value = "dt", value.isoformat()
+    else:
+        kind = "v"
+    payload = json.dumps([sort, kind, value, row_id], separators=(",", ":")).encode("utf-8")
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_cursor(token: str, sort: str) -> Tuple[Any, int]:
+    try:
+        payload_b64, mac_b64 = token.split(".")
+        payload = _b64decode(payload_b64)
+        mac = _b64decode(mac_b64)
+    except (ValueError, binascii.Error):
+        raise InvalidCursor("Malformed cursor")
+    if not hmac.compare_digest(mac, _sign(payload)):
+        raise InvalidCursor("Cursor signature mismatch")
+    try:
+        cursor_sort, kind, value, row_id = json.loads(payload)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    if kind == "dt":
+        value = datetime.fromisoformat(value)
+    return value, int(row_id)
+
+
+def apply_keyset(stmt, sort_column, id_column, cursor: Optional[str], sort: str, limit: int, descending: bool = False):
+    """
+    Order by (sort_column, id_column) and continue after `cursor`. Fetches
+    one extra row so the caller can tell whether another page exists.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        position = tuple_(sort_column, id_column)
+        stmt = stmt.where(position < (value, row_id) if descending else position > (value, row_id))
+    if descending:
+        stmt = stmt.order_by(sort_column.desc(), id_column.desc())
+    else:
+        stmt = stmt.order_by(sort_column, id_column)
+    return stmt.limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int, sort: str, sort_attr: str) -> Tuple[List[Any], Optional[str]]:
+    items = list(rows[:limit])
+    if len(rows) <= limit or not items:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(sort, getattr(last, sort_attr), last.id)
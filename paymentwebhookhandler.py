@@ -7,13 +7,14 @@ from enum import Enum
 from fastapi import APIRouter, Request, HTTPException, Depends
 from pydantic import BaseModel, Field, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text
 
 from db.session import get_db
 from models.payment import Payment as PaymentModel
 from models.subscription import Subscription as SubscriptionModel
 from config import settings
 from logger import logger
+from usercontextmiddleware import invalidate_user_context
 
 router = APIRouter(prefix="/webhooks", tags=["payment"])
 
@@ -93,6 +94,12 @@ async def update_subscription(db: AsyncSession, payload: PaymentWebhookPayload):
                     status="active"
                 )
                 db.add(new_subscription)
+            telegram_id = await db.scalar(
+                text("SELECT telegram_id FROM users WHERE id = :user_id"), {"user_id": payload.user_id}
+            )
     except Exception:
         logger.error("Error updating subscription")
-        raise
\ No newline at end of file
+        raise
+    if telegram_id is not None:
+        # The bot caches premium status per user; make the purchase visible on the next update.
+        await invalidate_user_context(telegram_id)
@@ -0,0 +1,196 @@
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_H, ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q
+except ImportError:  # optional: only the nightly batch worker needs it
+    qrcode = None
+
+try:
+    import billiard
+except ImportError:  # ships with Celery; plain scripts use concurrent.futures
+    billiard = None
+
+logger = logging.getLogger(__name__)
+
+QR_STORE_DIR = os.getenv("QR_STORE_DIR", "media/qr")
+MANIFEST_NAME = "manifest.json"
+# Bump when the rendering code changes so every code is regenerated once.
+RENDERER_VERSION = 1
+DEFAULT_OPTIONS = {
+    "error_correction": "M",
+    "box_size": 10,
+    "border": 4,
+    "fill_color": "black",
+    "back_color": "white",
+}
+DEFAULT_CHUNKSIZE = 16
+
+
+def spec_key(data: str, options: Dict[str, Any]) -> str:
+    """Content address of a code: sha256 over its payload and rendering options."""
+    canonical = json.dumps(
+        {"v": RENDERER_VERSION, "data": data, "options": options},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def render_qr(data: str, options: Dict[str, Any]) -> bytes:
+    if qrcode is None:
+        raise RuntimeError("The qrcode package is required to render QR codes")
+    levels = {"L": ERROR_CORRECT_L, "M": ERROR_CORRECT_M, "Q": ERROR_CORRECT_Q, "H": ERROR_CORRECT_H}
+    qr = qrcode.QRCode(
+        error_correction=levels[options["error_correction"]],
+        box_size=options["box_size"],
+        border=options["border"],
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color=options["fill_color"], back_color=options["back_color"])
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _render_job(job: Tuple[str, str, Dict[str, Any]]) -> Tuple[str, Optional[bytes], Optional[str]]:
+    key, data, options = job
+    try:
+        return key, render_qr(data, options), None
+    except Exception as e:
+        return key, None, str(e)
+
+
+def _atomic_write(path: str, payload: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _render_all(jobs: List[Tuple[str, str, Dict[str, Any]]], workers: Optional[int],
+                chunksize: int) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """
+    Render in a process pool that works where this process is running.
+    Celery prefork children are daemonic and may not start children through
+    multiprocessing, so there the pool comes from billiard (Celery's own
+    fork of multiprocessing), and without it the codes are rendered inline.
+    """
+    if not multiprocessing.current_process().daemon:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(_render_job, jobs, chunksize=chunksize)
+        return
+    if billiard is None:
+        logger.warning("Rendering %d QR codes inline: daemonic process and billiard is not installed", len(jobs))
+        yield from map(_render_job, jobs)
+        return
+    pool = billiard.Pool(processes=workers)
+    try:
+        yield from pool.imap(_render_job, jobs, chunksize=chunksize)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+class LocalObjectStore:
+    """
+    Filesystem stand-in for an object store: immutable objects addressed by
+    key under `objects/`, plus a JSON manifest mapping code names to keys.
+    """
+
+    def __init__(self, root: str = QR_STORE_DIR):
+        self.root = root
+
+    def object_path(self, key: str) -> str:
+        return os.path.join(self.root, "objects", key[:2], f"{key}.png")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.object_path(key))
+
+    def put(self, key: str, payload: bytes) -> str:
+        path = self.object_path(key)
+        _atomic_write(path, payload)
+        return path
+
+    def load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def save_manifest(self, manifest: Dict[str, Any]) -> None:
+        payload = json.dumps(manifest, sort_keys=True, indent=2, ensure_ascii=False).encode("utf-8")
+        _atomic_write(os.path.join(self.root, MANIFEST_NAME), payload)
+
+
+def generate_batch(
+    specs: Iterable[Dict[str, Any]],
+    store: Optional[LocalObjectStore] = None,
+    workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Dict[str, Any]:
+    """
+    Render every spec (`{"name": ..., "data": ..., **options}`) whose content
+    address is not in the store yet, using a process pool, and rewrite the
+    manifest. Unchanged codes cost one hash and one stat. Safe to call from
+    a Celery prefork task (see _render_all).
+    """
+    store = store or LocalObjectStore()
+    started = time.monotonic()
+    previous = store.load_manifest()
+    manifest: Dict[str, Any] = {}
+    jobs: Dict[str, Tuple[str, str, Dict[str, Any]]] = {}
+    for spec in specs:
+        spec = dict(spec)
+        name, data = spec.pop("name"), spec.pop("data")
+        options = dict(DEFAULT_OPTIONS, **spec)
+        key = spec_key(data, options)
+        manifest[name] = {"key": key, "path": os.path.relpath(store.object_path(key), store.root)}
+        if key not in jobs and not store.exists(key):
+            jobs[key] = (key, data, options)
+
+    failed: List[str] = []
+    if jobs:
+        for key, payload, error in _render_all(list(jobs.values()), workers, chunksize):
+            if error is not None:
+                logger.warning("QR render failed for %s: %s", key, error)
+                failed.append(key)
+                continue
+            store.put(key, payload)
+    failed_keys = set(failed)
+    for name in [name for name, entry in manifest.items() if entry["key"] in failed_keys]:
+        if name in previous:
+            manifest[name] = previous[name]
+        else:
+            del manifest[name]
+    store.save_manifest(manifest)
+
+    changed = sum(1 for name, entry in manifest.items() if previous.get(name, {}).get("key") != entry["key"])
+    report = {
+        "codes": len(manifest),
+        "rendered": len(jobs) - len(failed),
+        "failed": len(failed),
+        "changed": changed,
+        "removed": len(set(previous) - set(manifest)),
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("QR batch finished: %s", report)
+    return report
@@ -0,0 +1,120 @@
+import contextvars
+import logging
+import os
+import random
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from prometheus_client import Histogram
+
+from metrics import normalize_statement
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.getenv("QUERY_DIAGNOSTICS_SAMPLE_RATE", "0.1"))
+SLOW_QUERY_MS = float(os.getenv("QUERY_SLOW_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_N_PLUS_ONE_THRESHOLD", "5"))
+MAX_LOGGED_STATEMENT = 500
+
+STATEMENTS_PER_SCOPE = Histogram(
+    "db_statements_per_scope",
+    "SQL statements issued per request, update or session scope (sampled)",
+    ["scope"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+
+
+class QueryScope:
+    __slots__ = ("name", "statements", "duration", "shapes", "examples")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+        self.examples: Dict[str, str] = {}
+
+
+_current_scope: contextvars.ContextVar[Optional[QueryScope]] = contextvars.ContextVar("query_scope", default=None)
+
+
+def parameter_fingerprint(parameters: Any) -> str:
+    """Shape of the bound parameters (types and list lengths), never their values."""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {_type_name(value)}" for key, value in sorted(parameters.items())) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"[{len(parameters)} x {parameter_fingerprint(parameters[0])}]"
+        return "(" + ", ".join(_type_name(value) for value in parameters) + ")"
+    return _type_name(parameters)
+
+
+def _type_name(value: Any) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+@contextmanager
+def query_scope(name: str) -> Iterator[Optional[QueryScope]]:
+    """
+    Attribute the statements run inside the block to `name`. Only a sampled
+    fraction of scopes counts statements and checks for N+1 patterns;
+    slow-query logging applies to every statement.
+    """
+    if _current_scope.get() is not None or random.random() >= SAMPLE_RATE:
+        yield None
+        return
+    scope = QueryScope(name)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        _report(scope)
+
+
+def _report(scope: QueryScope) -> None:
+    if not scope.statements:
+        return
+    STATEMENTS_PER_SCOPE.labels(scope.name).observe(scope.statements)
+    for fingerprint, count in scope.shapes.items():
+        if count >= N_PLUS_ONE_THRESHOLD:
+            logger.warning(
+                "Possible N+1 in %s: statement %s ran %d times (%d statements, %.1f ms total): %s",
+                scope.name, fingerprint, count, scope.statements, scope.duration * 1000,
+                normalize_statement(scope.examples[fingerprint])[:MAX_LOGGED_STATEMENT],
+            )
+
+
+class QueryScopeMiddleware:
+    """Outer update middleware opening a query scope per Telegram update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        with query_scope(f"update:{getattr(event, 'event_type', None) or 'unknown'}"):
+            return await handler(event, data)
+
+
+def observe_query(statement: str, parameters: Any, elapsed: float, fingerprint: str) -> None:
+    """Query observer for metrics.instrument_engine, which already times and fingerprints statements."""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.statements += 1
+        scope.duration += elapsed
+        scope.shapes[fingerprint] += 1
+        scope.examples.setdefault(fingerprint, statement)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s params=%s: %s",
+            elapsed * 1000,
+            scope.name if scope is not None else "unscoped",
+            fingerprint,
+            parameter_fingerprint(parameters),
+            normalize_statement(statement)[:MAX_LOGGED_STATEMENT],
+        )
@@ -1,13 +1,22 @@
 import logging
 import uuid
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
 from redis.asyncio import Redis
 from redis.asyncio.exceptions import RedisError
 
 logger = logging.getLogger(__name__)
 
+ALGORITHM_SORTED_SET = "sorted_set"
+ALGORITHM_GCRA = "gcra"
+
 class RateLimiter:
     """
-    Rate limiter using Redis sorted sets and Lua script for atomic operations.
+    Rate limiter using Redis and Lua scripts for atomic operations.
+
+    The "sorted_set" algorithm keeps one member per request inside the window.
+    The "gcra" algorithm keeps a single theoretical arrival time per key, so
+    memory and work per attempt do not grow with max_requests; it allows a
+    burst of max_requests and then one request every window/max_requests.
     """
 
     _lua_script = """
@@ -30,21 +39,125 @@ else
 end
 """
 
-    def __init__(self, redis_client: Redis, max_requests: int, window_seconds: int, prefix: str = "rl"):
+    _gcra_lua_script = """
+local key = KEYS[1]
+local window_us = tonumber(ARGV[1]) * 1000000
+local interval_us = window_us / tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now_us = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local tat = tonumber(redis.call('GET', key)) or now_us
+if tat < now_us then
+    tat = now_us
+end
+local new_tat = tat + interval_us
+if new_tat - now_us > window_us then
+    return 0
+end
+redis.call('SET', key, string.format('%d', new_tat), 'PX', math.ceil((new_tat - now_us) / 1000))
+return 1
+"""
+
+    def __init__(self, redis_client: Redis, max_requests: int, window_seconds: int, prefix: str = "rl",
+                 algorithm: str = ALGORITHM_SORTED_SET):
+        if algorithm not in (ALGORITHM_SORTED_SET, ALGORITHM_GCRA):
+            raise ValueError(f"Unknown rate limiting algorithm: {algorithm}")
         self.redis = redis_client
         self.max_requests = max_requests
         self.window_seconds = window_seconds
         self.prefix = prefix
+        self.algorithm = algorithm
 
     def _key(self, identifier: str) -> str:
         return f"{self.prefix}:{identifier}"
 
     async def attempt(self, identifier: str) -> bool:
         key = self._key(identifier)
-        member = uuid.uuid4().hex
         try:
-            result = await self.redis.eval(self._lua_script, 1, key, self.window_seconds, self.max_requests, member)
+            if self.algorithm == ALGORITHM_GCRA:
+                result = await self.redis.eval(self._gcra_lua_script, 1, key, self.window_seconds, self.max_requests)
+            else:
+                member = uuid.uuid4().hex
+                result = await self.redis.eval(self._lua_script, 1, key, self.window_seconds, self.max_requests, member)
             return bool(result)
         except RedisError as e:
             logger.error("Redis error during rate limiting attempt for %s: %s", identifier, e)
-            return True
\ No newline at end of file
+            return True
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    dimension: Optional[str] = None
+    retry_after: float = 0.0
+
+
+class CompositeRateLimiter:
+    """
+    Checks several GCRA budgets (e.g. per-user, per-chat, per-endpoint-class
+    and global) in one atomic Redis call. A request is counted against every
+    dimension only when all of them allow it; otherwise nothing is written
+    and the first dimension that tripped is reported.
+
+    The script is registered once and invoked with EVALSHA.
+    """
+
+    _lua_script = """
+local time = redis.call('TIME')
+local now_us = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local new_tats = {}
+for i, key in ipairs(KEYS) do
+    local window_us = tonumber(ARGV[i * 2 - 1]) * 1000000
+    local interval_us = window_us / tonumber(ARGV[i * 2])
+    local tat = tonumber(redis.call('GET', key)) or now_us
+    if tat < now_us then
+        tat = now_us
+    end
+    local new_tat = tat + interval_us
+    if new_tat - now_us > window_us then
+        return {0, i, math.ceil((new_tat - now_us - window_us) / 1000)}
+    end
+    new_tats[i] = new_tat
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, string.format('%d', new_tats[i]), 'PX', math.ceil((new_tats[i] - now_us) / 1000))
+end
+return {1, 0, 0}
+"""
+
+    def __init__(self, redis_client: Redis, dimensions: Sequence[Tuple[str, int, int]], prefix: str = "crl"):
+        """
+        `dimensions` is a sequence of (name, max_requests, window_seconds),
+        checked in the given order.
+        """
+        if not dimensions:
+            raise ValueError("At least one rate limit dimension is required")
+        self.redis = redis_client
+        self.dimensions = list(dimensions)
+        self.prefix = prefix
+        self._script = redis_client.register_script(self._lua_script)
+
+    def _key(self, dimension: str, identifier: str) -> str:
+        return f"{self.prefix}:{dimension}:{identifier}"
+
+    async def attempt(self, identifiers: Dict[str, str]) -> RateLimitResult:
+        """
+        `identifiers` maps dimension names to identifiers, e.g.
+        {"user": "42", "chat": "-100123", "endpoint": "search", "global": "all"}.
+        Dimensions without an identifier are skipped.
+        """
+        names, keys, args = [], [], []
+        for name, max_requests, window_seconds in self.dimensions:
+            identifier = identifiers.get(name)
+            if identifier is None:
+                continue
+            names.append(name)
+            keys.append(self._key(name, identifier))
+            args.extend((window_seconds, max_requests))
+        if not keys:
+            return RateLimitResult(True)
+        try:
+            allowed, index, retry_after_ms = await self._script(keys=keys, args=args)
+        except RedisError as e:
+            logger.error("Redis error during composite rate limiting attempt for %s: %s", identifiers, e)
+            return RateLimitResult(True)
+        if allowed:
+            return RateLimitResult(True)
+        return RateLimitResult(False, names[int(index) - 1], int(retry_after_ms) / 1000)
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import os
+import time
+
+from redis.asyncio import Redis
+
+from ratelimiter import ALGORITHM_GCRA, ALGORITHM_SORTED_SET, RateLimiter
+
+BENCH_PREFIX = "rlbench"
+
+
+async def _memory_usage(redis: Redis, pattern: str) -> int:
+    total = 0
+    async for key in redis.scan_iter(match=pattern, count=1000):
+        total += await redis.memory_usage(key) or 0
+    return total
+
+
+async def _cleanup(redis: Redis, pattern: str) -> None:
+    async for key in redis.scan_iter(match=pattern, count=1000):
+        await redis.delete(key)
+
+
+async def bench(redis: Redis, algorithm: str, keys: int, attempts: int, max_requests: int,
+                window: int, concurrency: int) -> dict:
+    prefix = f"{BENCH_PREFIX}:{algorithm}"
+    pattern = f"{prefix}:*"
+    await _cleanup(redis, pattern)
+    limiter = RateLimiter(redis, max_requests, window, prefix=prefix, algorithm=algorithm)
+    semaphore = asyncio.Semaphore(concurrency)
+    allowed = 0
+
+    async def one(identifier: str) -> None:
+        nonlocal allowed
+        async with semaphore:
+            if await limiter.attempt(identifier):
+                allowed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(f"user{n % keys}") for n in range(keys * attempts)))
+    elapsed = time.perf_counter() - started
+    memory = await _memory_usage(redis, pattern)
+    await _cleanup(redis, pattern)
+    return {
+        "algorithm": algorithm,
+        "ops_per_sec": keys * attempts / elapsed,
+        "allowed": allowed,
+        "memory_bytes": memory,
+        "bytes_per_key": memory / keys,
+    }
+
+
+async def run(args) -> None:
+    redis = Redis.from_url(args.redis_url)
+    try:
+        print(f"{'algorithm':<12} {'ops/sec':>10} {'allowed':>9} {'memory':>12} {'bytes/key':>10}")
+        for algorithm in (ALGORITHM_SORTED_SET, ALGORITHM_GCRA):
+            result = await bench(redis, algorithm, args.keys, args.attempts, args.max_requests,
+                                 args.window, args.concurrency)
+            print(
+                f"{result['algorithm']:<12} {result['ops_per_sec']:>10.0f} {result['allowed']:>9} "
+                f"{result['memory_bytes']:>12} {result['bytes_per_key']:>10.1f}"
+            )
+    finally:
+        await redis.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare RateLimiter algorithms on Redis memory and throughput")
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--keys", type=int, default=1000, help="number of distinct identifiers")
+    parser.add_argument("--attempts", type=int, default=200, help="attempts per identifier")
+    parser.add_argument("--max-requests", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=60, help="window in seconds")
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 import os
+import math
+import time
+import asyncio
 import logging
+from collections import OrderedDict
+from typing import Optional
 import redis.asyncio as redis
+from prometheus_client import Counter
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
+from ratelimiter import CompositeRateLimiter
+
 LOGGER = logging.getLogger(__name__)
 
 def get_env_int(var_name: str, default: int) -> int:
@@ -17,6 +25,12 @@ def get_env_int(var_name: str, default: int) -> int:
         LOGGER.warning(f"Invalid integer for {var_name}: {val}, using default {default}")
         return default
 
+def get_env_bool(var_name: str, default: bool) -> bool:
+    val = os.getenv(var_name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
 def get_env_list(var_name: str) -> list[str]:
     val = os.getenv(var_name, "")
     return [item.strip() for item in val.split(",") if item.strip()]
@@ -25,6 +39,32 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 RATE_LIMIT = get_env_int("RATE_LIMIT", 100)
 RATE_LIMIT_WINDOW = get_env_int("RATE_LIMIT_WINDOW", 60)
 TRUSTED_PROXIES = get_env_list("TRUSTED_PROXIES")
+# "redis" checks every request against Redis; "hybrid" serves requests from a
+# per-process token bucket that leases quota from Redis in blocks; "composite"
+# checks the client, endpoint-class and global budgets in one Redis call.
+RATE_LIMIT_MODE = os.getenv("RATE_LIMIT_MODE", "hybrid")
+# Bigger leases mean fewer Redis calls but more quota parked in idle processes.
+RATE_LIMIT_LEASE_SIZE = get_env_int("RATE_LIMIT_LEASE_SIZE", max(1, RATE_LIMIT // 10))
+# Refill in the background once a bucket drops to this many tokens.
+RATE_LIMIT_LEASE_LOW_WATERMARK = get_env_int("RATE_LIMIT_LEASE_LOW_WATERMARK", RATE_LIMIT_LEASE_SIZE // 4)
+# Unused tokens of buckets idle this long are returned to the shared budget.
+RATE_LIMIT_RECONCILE_INTERVAL = get_env_int("RATE_LIMIT_RECONCILE_INTERVAL", 10)
+RATE_LIMIT_MAX_CLIENTS = get_env_int("RATE_LIMIT_MAX_CLIENTS", 100000)
+RATE_LIMIT_FAIL_OPEN = get_env_bool("RATE_LIMIT_FAIL_OPEN", RATE_LIMIT_MODE == "hybrid")
+# After a failed lease, Redis is left alone for this many seconds and requests
+# are limited per process (or denied when not failing open).
+RATE_LIMIT_CIRCUIT_INTERVAL = get_env_int("RATE_LIMIT_CIRCUIT_INTERVAL", 5)
+# Composite mode: per-client budget for each endpoint class (first path
+# segment; anything not listed is "other") and one budget shared by all
+# clients. 0 disables a dimension.
+RATE_LIMIT_ENDPOINT = get_env_int("RATE_LIMIT_ENDPOINT", 0)
+RATE_LIMIT_ENDPOINT_CLASSES = frozenset(get_env_list("RATE_LIMIT_ENDPOINT_CLASSES"))
+RATE_LIMIT_GLOBAL = get_env_int("RATE_LIMIT_GLOBAL", 0)
+
+LEASES = Counter("rate_limit_leases_total", "Quota lease requests sent to Redis", ["result"])
+LEASED_TOKENS = Counter("rate_limit_leased_tokens_total", "Tokens granted by Redis leases")
+RETURNED_TOKENS = Counter("rate_limit_returned_tokens_total", "Unused leased tokens returned to Redis")
+LOCAL_DECISIONS = Counter("rate_limit_local_decisions_total", "Requests decided from the local bucket", ["decision"])
 
 LUA_RATE_LIMIT_SCRIPT = """
 local count = redis.call("INCR", KEYS[1])
@@ -37,17 +77,89 @@ else
 end
 """
 
+# Grants up to ARGV[3] tokens from the same fixed-window counter the plain
+# "redis" mode increments, so both modes can run side by side.
+LUA_LEASE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local used = tonumber(redis.call("GET", KEYS[1]) or "0")
+local grant = math.min(want, limit - used)
+if grant <= 0 then
+    local ttl = redis.call("TTL", KEYS[1])
+    if ttl < 0 then ttl = window end
+    return {0, ttl}
+end
+local total = redis.call("INCRBY", KEYS[1], grant)
+local ttl = redis.call("TTL", KEYS[1])
+if total == grant or ttl < 0 then
+    redis.call("EXPIRE", KEYS[1], window)
+    ttl = window
+end
+return {grant, ttl}
+"""
+
+# Gives unused tokens back to the current window only. A key that has already
+# expired is not recreated, and the remaining TTL is kept.
+LUA_RETURN_SCRIPT = """
+local ttl = redis.call("PTTL", KEYS[1])
+if ttl <= 0 then
+    return 0
+end
+local left = redis.call("DECRBY", KEYS[1], ARGV[1])
+if left < 0 then
+    redis.call("SET", KEYS[1], 0, "PX", ttl)
+end
+return 1
+"""
+
+class _LocalBucket:
+    __slots__ = (
+        "tokens", "expires_at", "blocked_until", "last_used", "refill",
+        "fallback_used", "fallback_reset_at",
+    )
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.blocked_until = 0.0
+        self.last_used = 0.0
+        self.refill: Optional[asyncio.Task] = None
+        # Fixed-window counter used only while Redis is unreachable.
+        self.fallback_used = 0
+        self.fallback_reset_at = 0.0
+
 class RateLimiterMiddleware(BaseHTTPMiddleware):
     def __init__(self, app):
         super().__init__(app)
         self.redis = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
         self.limit = RATE_LIMIT
         self.window = RATE_LIMIT_WINDOW
+        self.mode = RATE_LIMIT_MODE
+        self.lease_size = max(1, min(RATE_LIMIT_LEASE_SIZE, self.limit))
+        self.low_watermark = RATE_LIMIT_LEASE_LOW_WATERMARK
+        self.fail_open = RATE_LIMIT_FAIL_OPEN
+        self._buckets: "OrderedDict[str, _LocalBucket]" = OrderedDict()
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._redis_retry_at = 0.0
+        self._composite: Optional[CompositeRateLimiter] = None
+        if self.mode == "composite":
+            dimensions = [("client", self.limit, self.window)]
+            if RATE_LIMIT_ENDPOINT > 0:
+                dimensions.append(("endpoint", RATE_LIMIT_ENDPOINT, self.window))
+            if RATE_LIMIT_GLOBAL > 0:
+                dimensions.append(("global", RATE_LIMIT_GLOBAL, self.window))
+            self._composite = CompositeRateLimiter(self.redis, dimensions, prefix="rl")
 
     async def dispatch(self, request: Request, call_next):
         client_ip = self.get_client_ip(request)
         key = f"rl:{client_ip}"
-        allowed, ttl = await self.check_rate_limit(key)
+        if self.mode == "hybrid":
+            allowed, ttl = await self.check_local_bucket(key)
+        elif self._composite is not None:
+            allowed, ttl = await self.check_composite(client_ip, request.url.path)
+        else:
+            allowed, ttl = await self.check_rate_limit(key)
         if not allowed:
             LOGGER.warning(f"Rate limit exceeded for {client_ip}")
             retry_after = ttl if ttl > 0 else self.window
@@ -76,6 +188,128 @@ class RateLimiterMiddleware(BaseHTTPMiddleware):
             LOGGER.error(f"Error checking rate limit for key {key}: {e}")
             return False, self.window
 
+    async def check_composite(self, client_ip: str, path: str) -> tuple[bool, int]:
+        segment = path.strip("/").split("/", 1)[0]
+        endpoint_class = segment if segment in RATE_LIMIT_ENDPOINT_CLASSES else "other"
+        result = await self._composite.attempt({
+            "client": client_ip,
+            "endpoint": f"{endpoint_class}:{client_ip}",
+            "global": "all",
+        })
+        if not result.allowed:
+            LOGGER.warning(f"Rate limit {result.dimension} budget exceeded for {client_ip}")
+        return result.allowed, math.ceil(result.retry_after)
+
+    def _bucket(self, key: str) -> _LocalBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _LocalBucket()
+            while len(self._buckets) > RATE_LIMIT_MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def check_local_bucket(self, key: str) -> tuple[bool, int]:
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+        now = time.monotonic()
+        bucket = self._bucket(key)
+        bucket.last_used = now
+        if bucket.expires_at <= now:
+            bucket.tokens = 0
+        if bucket.tokens > 0:
+            bucket.tokens -= 1
+            LOCAL_DECISIONS.labels("allow").inc()
+            if (bucket.tokens <= self.low_watermark and not self._circuit_open(now)
+                    and (bucket.refill is None or bucket.refill.done())):
+                bucket.refill = asyncio.create_task(self._lease(key, bucket))
+            return True, 0
+        if bucket.blocked_until > now:
+            LOCAL_DECISIONS.labels("deny").inc()
+            return False, math.ceil(bucket.blocked_until - now)
+        if self._circuit_open(now):
+            return self._without_redis(bucket, now)
+        if bucket.refill is not None and not bucket.refill.done():
+            await asyncio.shield(bucket.refill)
+        else:
+            await self._lease(key, bucket)
+        now = time.monotonic()
+        if bucket.tokens > 0:
+            bucket.tokens -= 1
+            return True, 0
+        if bucket.blocked_until > now:
+            return False, math.ceil(bucket.blocked_until - now)
+        if self._circuit_open(now):
+            return self._without_redis(bucket, now)
+        return False, self.window
+
+    def _circuit_open(self, now: float) -> bool:
+        return self._redis_retry_at > now
+
+    def _without_redis(self, bucket: _LocalBucket, now: float) -> tuple[bool, int]:
+        if not self.fail_open:
+            LOCAL_DECISIONS.labels("deny").inc()
+            return False, math.ceil(self._redis_retry_at - now)
+        # Enforce the limit per process: the counter only resets with its own
+        # window, never because a lease failed.
+        if bucket.fallback_reset_at <= now:
+            bucket.fallback_used = 0
+            bucket.fallback_reset_at = now + self.window
+        if bucket.fallback_used < self.limit:
+            bucket.fallback_used += 1
+            LOCAL_DECISIONS.labels("fallback_allow").inc()
+            return True, 0
+        LOCAL_DECISIONS.labels("fallback_deny").inc()
+        return False, math.ceil(bucket.fallback_reset_at - now)
+
+    async def _lease(self, key: str, bucket: _LocalBucket) -> None:
+        try:
+            result = await self.redis.eval(LUA_LEASE_SCRIPT, 1, key, self.limit, self.window, self.lease_size)
+            granted, ttl = int(result[0]), int(result[1])
+        except Exception as e:
+            LEASES.labels("error").inc()
+            LOGGER.error(f"Error leasing rate limit quota for key {key}: {e}")
+            self._redis_retry_at = time.monotonic() + RATE_LIMIT_CIRCUIT_INTERVAL
+            return
+        now = time.monotonic()
+        if ttl <= 0:
+            ttl = self.window
+        if granted > 0:
+            LEASES.labels("granted").inc()
+            LEASED_TOKENS.inc(granted)
+            if bucket.expires_at <= now:
+                bucket.tokens = 0
+            bucket.tokens += granted
+            bucket.expires_at = now + ttl
+        else:
+            LEASES.labels("denied").inc()
+            bucket.blocked_until = now + ttl
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            await asyncio.sleep(RATE_LIMIT_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                LOGGER.error(f"Error reconciling rate limit leases: {e}")
+
+    async def reconcile(self) -> None:
+        now = time.monotonic()
+        idle_before = now - RATE_LIMIT_RECONCILE_INTERVAL
+        returns = []
+        for key, bucket in self._buckets.items():
+            if bucket.tokens > 0 and bucket.expires_at > now and bucket.last_used < idle_before:
+                returns.append((key, bucket.tokens))
+                bucket.tokens = 0
+        if not returns:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for key, tokens in returns:
+            pipe.eval(LUA_RETURN_SCRIPT, 1, key, tokens)
+        results = await pipe.execute()
+        RETURNED_TOKENS.inc(sum(tokens for (_, tokens), returned in zip(returns, results) if returned))
+
     @staticmethod
     def get_client_ip(request: Request) -> str:
         forwarded = request.headers.get("X-Forwarded-For")
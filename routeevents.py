@@ -0,0 +1,24 @@
+import logging
+from typing import Optional
+
+from core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+ROUTES_CHANGED_CHANNEL = "routes:changed"
+ROUTES_VERSION_KEY = "routes:version"
+
+
+async def notify_routes_changed() -> Optional[int]:
+    """
+    Bump the route catalog version and broadcast it so in-process route
+    indexes and caches rebuild. Failures are logged, never raised: the
+    database write has already been committed.
+    """
+    try:
+        version = await redis_client.incr(ROUTES_VERSION_KEY)
+        await redis_client.publish(ROUTES_CHANGED_CHANNEL, str(version))
+        return version
+    except Exception as e:
+        logger.warning("Failed to broadcast route catalog change: %s", e)
+        return None
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+IMPORT_LANGUAGES = ("en", "ru", "be")
+DIFFICULTIES = ("easy", "medium", "hard")
+DEFAULT_BATCH_SIZE = 500
+
+ROUTE_STAGE_COLUMNS = ("slug", "language_code", "title", "description", "published", "details")
+POINT_STAGE_COLUMNS = ("slug", "order_index", "latitude", "longitude")
+
+CREATE_STAGE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS route_import_stage (
+    slug text NOT NULL,
+    language_code varchar(10) NOT NULL,
+    title text NOT NULL,
+    description text,
+    published boolean NOT NULL,
+    details jsonb NOT NULL
+);
+CREATE TEMP TABLE IF NOT EXISTS route_point_import_stage (
+    slug text NOT NULL,
+    order_index integer NOT NULL,
+    latitude double precision NOT NULL,
+    longitude double precision NOT NULL
+);
+"""
+
+MERGE_ROUTES_SQL = """
+WITH merged AS (
+INSERT INTO tour_routes (slug, language_code, title, description, published, details, created_at, updated_at)
+SELECT slug, language_code, title, description, published, details, now(), now()
+FROM route_import_stage
+ON CONFLICT (slug, language_code) DO UPDATE SET
+    title = EXCLUDED.title,
+    description = EXCLUDED.description,
+    published = EXCLUDED.published,
+    details = EXCLUDED.details,
+    updated_at = now()
+RETURNING xmax = 0 AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted) FROM merged
+"""
+
+DELETE_POINTS_SQL = """
+DELETE FROM route_points rp
+USING tour_routes tr
+WHERE rp.route_id = tr.id
+  AND tr.slug IN (SELECT DISTINCT slug FROM route_point_import_stage)
+"""
+
+INSERT_POINTS_SQL = """
+INSERT INTO route_points (route_id, latitude, longitude, order_index)
+SELECT tr.id, s.latitude, s.longitude, s.order_index
+FROM route_point_import_stage s
+JOIN tour_routes tr ON tr.slug = s.slug
+"""
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.routes_upserted = 0
+        self.routes_created = 0
+        self.points_loaded = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def add_error(self, line: int, message: str) -> None:
+        self.errors.append((line, message))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows_read": self.rows_read,
+            "rows_imported": self.rows_imported,
+            "routes_upserted": self.routes_upserted,
+            "routes_created": self.routes_created,
+            "points_loaded": self.points_loaded,
+            "errors": [{"line": line, "error": message} for line, message in self.errors],
+        }
+
+
+def _split(value: Optional[str], sep: str) -> List[str]:
+    return [item.strip() for item in (value or "").split(sep) if item.strip()]
+
+
+def _float(row: Dict[str, str], field: str) -> Optional[float]:
+    value = (row.get(field) or "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise RowError(f"{field} is not a number: {value!r}")
+
+
+def parse_waypoints(value: str) -> List[Tuple[float, float]]:
+    points = []
+    for raw in _split(value, ";"):
+        parts = raw.split(",")
+        if len(parts) != 2:
+            raise RowError(f"waypoint must be 'lat,lon': {raw!r}")
+        try:
+            lat, lon = float(parts[0]), float(parts[1])
+        except ValueError:
+            raise RowError(f"waypoint is not numeric: {raw!r}")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise RowError(f"waypoint out of range: {raw!r}")
+        points.append((lat, lon))
+    return points
+
+
+def parse_row(row: Dict[str, str]) -> Tuple[List[tuple], List[tuple]]:
+    slug = (row.get("slug") or "").strip()
+    if not slug:
+        raise RowError("slug is required")
+    difficulty = (row.get("difficulty") or "").strip().lower() or None
+    if difficulty is not None and difficulty not in DIFFICULTIES:
+        raise RowError(f"unknown difficulty: {difficulty!r}")
+    waypoints = parse_waypoints(row.get("waypoints", ""))
+    if len(waypoints) < 2:
+        raise RowError("at least two waypoints are required")
+    published = (row.get("status") or "").strip().lower() == "published"
+    image_urls = _split(row.get("image_urls"), ",")
+    common = {
+        "distance_km": _float(row, "distance_km"),
+        "duration_hours": _float(row, "duration_hours"),
+        "difficulty": difficulty,
+        "tags": _split(row.get("tags"), ","),
+    }
+    routes = []
+    for lang in IMPORT_LANGUAGES:
+        title = (row.get(f"name_{lang}") or "").strip()
+        if not title:
+            continue
+        alts = _split(row.get(f"image_alts_{lang}"), ";")
+        details = dict(
+            common,
+            region=(row.get(f"region_{lang}") or "").strip() or None,
+            images=[
+                {"url": url, "alt": alts[index] if index < len(alts) else None}
+                for index, url in enumerate(image_urls)
+            ],
+        )
+        routes.append((
+            slug,
+            lang,
+            title,
+            (row.get(f"description_{lang}") or "").strip() or None,
+            published,
+            json.dumps(details, ensure_ascii=False),
+        ))
+    if not routes:
+        raise RowError("at least one localized name is required")
+    points = [(slug, index, lat, lon) for index, (lat, lon) in enumerate(waypoints)]
+    return routes, points
+
+
+def iter_batches(
+    stream: TextIO,
+    report: ImportReport,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[Dict[str, Tuple[int, List[tuple], List[tuple]]]]:
+    reader = csv.DictReader(stream)
+    batch: Dict[str, Tuple[int, List[tuple], List[tuple]]] = {}
+    for row in reader:
+        report.rows_read += 1
+        line = reader.line_num
+        try:
+            routes, points = parse_row(row)
+        except RowError as e:
+            report.add_error(line, str(e))
+            continue
+        slug = routes[0][0]
+        if slug in batch:
+            # ON CONFLICT cannot touch the same row twice in one statement; last row wins.
+            report.add_error(batch[slug][0], f"superseded by duplicate slug {slug!r} on line {line}")
+        batch[slug] = (line, routes, points)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+async def _load_batch(conn: asyncpg.Connection, batch: Dict[str, Tuple[int, List[tuple], List[tuple]]]) -> Tuple[int, int, int]:
+    route_records = [record for _, routes, _ in batch.values() for record in routes]
+    point_records = [record for _, _, points in batch.values() for record in points]
+    async with conn.transaction():
+        await conn.execute("TRUNCATE route_import_stage, route_point_import_stage")
+        await conn.copy_records_to_table("route_import_stage", records=route_records, columns=ROUTE_STAGE_COLUMNS)
+        await conn.copy_records_to_table("route_point_import_stage", records=point_records, columns=POINT_STAGE_COLUMNS)
+        created = await conn.fetchval(MERGE_ROUTES_SQL)
+        await conn.execute(DELETE_POINTS_SQL)
+        status = await conn.execute(INSERT_POINTS_SQL)
+    return len(route_records), created, int(status.rsplit(" ", 1)[-1])
+
+
+async def _import_batch(
+    conn: asyncpg.Connection,
+    batch: Dict[str, Tuple[int, List[tuple], List[tuple]]],
+    report: ImportReport,
+) -> None:
+    routes, created, points = await _load_batch(conn, batch)
+    report.rows_imported += len(batch)
+    report.routes_upserted += routes
+    report.routes_created += created
+    report.points_loaded += points
+
+
+async def import_routes(
+    conn: asyncpg.Connection,
+    stream: TextIO,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> ImportReport:
+    """
+    Stream routes from a routes_bulk.csv-style file into tour_routes and
+    route_points. Each CSV row becomes one tour_routes row per language that
+    has a name, upserted on (slug, language_code); its waypoints replace the
+    existing route points. Batches are committed independently; when one is
+    rejected its rows are retried one by one, so only the offending rows are
+    reported and the rest of the batch is still imported.
+    """
+    report = ImportReport()
+    await conn.execute(CREATE_STAGE_SQL)
+    for batch in iter_batches(stream, report, batch_size):
+        try:
+            await _import_batch(conn, batch, report)
+        except asyncpg.PostgresError as e:
+            logger.warning("Route import batch failed, retrying %d rows one by one: %s", len(batch), e)
+            for slug, entry in batch.items():
+                try:
+                    await _import_batch(conn, {slug: entry}, report)
+                except asyncpg.PostgresError as row_error:
+                    report.add_error(entry[0], f"rejected by database: {row_error}")
+    logger.info(
+        "Route import finished: %d rows read, %d imported, %d errors",
+        report.rows_read, report.rows_imported, len(report.errors),
+    )
+    return report
+
+
+def _asyncpg_dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+async def _run_cli(path: str, dsn: str, batch_size: int) -> ImportReport:
+    conn = await asyncpg.connect(_asyncpg_dsn(dsn))
+    try:
+        with io.open(path, "r", encoding="utf-8", newline="") as stream:
+            report = await import_routes(conn, stream, batch_size)
+    finally:
+        await conn.close()
+    from routeevents import notify_routes_changed
+    from statsstore import record_counter
+    if report.routes_created:
+        await record_counter("routes", report.routes_created)
+    await notify_routes_changed()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk import routes from a CSV file")
+    parser.add_argument("path", help="CSV file in routes_bulk.csv format")
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="PostgreSQL DSN (default: $DATABASE_URL)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    report = asyncio.run(_run_cli(args.path, args.dsn, args.batch_size))
+    json.dump(report.as_dict(), sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    if report.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import heapq
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+DEFAULT_CELL_DEGREES = 0.1
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of `radius_m` meters."""
+    dlat = radius_m / METERS_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    dlon = min(radius_m / (METERS_PER_DEGREE * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def nearest_point_m(lat: float, lon: float, points: Iterable[Tuple[float, float]]) -> float:
+    """Distance to the closest of `points`; the route distance used by both the index and PostGIS path."""
+    return min((haversine_m(lat, lon, p_lat, p_lon) for p_lat, p_lon in points), default=math.inf)
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 6) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        index = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (index >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_cell(geohash: str) -> Tuple[float, float, float]:
+    """Return the cell center and the distance in meters from it to a corner."""
+    min_lat, max_lat, min_lon, max_lon = geohash_bounds(geohash)
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+    corner_lat = max_lat if abs(max_lat) > abs(min_lat) else min_lat
+    return center_lat, center_lon, haversine_m(center_lat, center_lon, corner_lat, max_lon)
+
+
+class RouteSpatialIndex:
+    """
+    Fixed-size lat/lon grid over route start points and waypoints.
+
+    A route's distance is the distance to its nearest indexed point. The
+    index is rebuilt wholesale and swapped in, so readers never see a
+    half-built grid.
+    """
+
+    def __init__(self, cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._grid: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+        self._routes: Dict[int, Dict[str, Any]] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def _cell_range(self, lat: float, lon: float, radius_m: float) -> Tuple[int, int, int, int]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+        min_i, min_j = self._cell(min_lat, min_lon)
+        max_i, max_j = self._cell(max_lat, max_lon)
+        return min_i, min_j, max_i, max_j
+
+    def build(
+        self,
+        routes: Dict[int, Dict[str, Any]],
+        points: Iterable[Tuple[int, float, float]],
+    ) -> None:
+        grid: Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+        for route_id, lat, lon in points:
+            if route_id not in routes or lat is None or lon is None:
+                continue
+            grid.setdefault(self._cell(lat, lon), []).append((lat, lon, route_id))
+        self._grid = grid
+        self._routes = routes
+        self.ready = True
+
+    def invalidate(self) -> None:
+        self.ready = False
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius_m: float,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        min_i, min_j, max_i, max_j = self._cell_range(lat, lon, radius_m)
+        best: Dict[int, float] = {}
+        grid = self._grid
+        for i in range(min_i, max_i + 1):
+            for j in range(min_j, max_j + 1):
+                for p_lat, p_lon, route_id in grid.get((i, j), ()):
+                    distance = haversine_m(lat, lon, p_lat, p_lon)
+                    if distance <= radius_m and distance < best.get(route_id, math.inf):
+                        best[route_id] = distance
+        if limit is None:
+            nearest = sorted(best.items(), key=lambda item: item[1])
+        else:
+            nearest = heapq.nsmallest(limit, best.items(), key=lambda item: item[1])
+        return [dict(self._routes[route_id], distance=distance) for route_id, distance in nearest]
@@ -0,0 +1,198 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, Optional, Set
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.orm import Session
+
+from core.redis import redis_client
+from localcache import LocalTTLCache
+from models import Route, User, UserQuizResult, UserBadge
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("routes", "users", "premium_active", "quiz_completions", "badges_awarded")
+DAU_KEY_TTL = 3 * 86400  # seconds
+SNAPSHOT_TTL = 5  # seconds the dashboard snapshot is served from memory
+ACTIVE_USERS_FLUSH_INTERVAL = 10  # seconds
+
+_snapshot_cache = LocalTTLCache(maxsize=1, ttl=SNAPSHOT_TTL)
+
+# Sets each counter to its recount only if it still holds the value read
+# before counting. ARGV holds the expected values ("" for a missing key)
+# followed by the recounts; returns the positions that were left alone.
+LUA_SET_IF_UNCHANGED = """
+local n = #KEYS
+local skipped = {}
+for i = 1, n do
+    local current = redis.call('GET', KEYS[i]) or ''
+    if current == ARGV[i] then
+        redis.call('SET', KEYS[i], ARGV[n + i])
+    else
+        table.insert(skipped, i)
+    end
+end
+return skipped
+"""
+
+
+def counter_key(name: str) -> str:
+    return f"stats:{name}"
+
+
+def dau_key(day: Optional[datetime.date] = None) -> str:
+    day = day or datetime.datetime.utcnow().date()
+    return f"stats:dau:{day.isoformat()}"
+
+
+async def record_counter(name: str, amount: int = 1) -> None:
+    """
+    Apply a delta to one of the COUNTERS after a committed write. Errors are
+    logged and swallowed; the periodic reconciliation corrects any drift.
+    """
+    if name not in COUNTERS:
+        raise ValueError(f"Unknown statistics counter: {name}")
+    try:
+        await redis_client.incrby(counter_key(name), amount)
+    except Exception as e:
+        logger.warning("Failed to update statistics counter %s: %s", name, e)
+
+
+# Counters kept incrementally from ORM writes wherever they happen.
+ORM_COUNTED_MODELS = {UserQuizResult: "quiz_completions", UserBadge: "badges_awarded"}
+_counter_tasks: Set[asyncio.Task] = set()
+
+
+def _pending_deltas(session) -> Dict[str, int]:
+    return session.info.setdefault("stats_deltas", {})
+
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_rows(session, flush_context) -> None:
+    deltas = _pending_deltas(session)
+    for objects, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            name = ORM_COUNTED_MODELS.get(type(obj))
+            if name is not None:
+                deltas[name] = deltas.get(name, 0) + sign
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_deltas(session) -> None:
+    deltas = session.info.pop("stats_deltas", None)
+    if not deltas:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # sync session outside the event loop; reconciliation catches up
+    for name, amount in deltas.items():
+        if amount:
+            task = loop.create_task(record_counter(name, amount))
+            _counter_tasks.add(task)
+            task.add_done_callback(_counter_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_deltas(session) -> None:
+    session.info.pop("stats_deltas", None)
+
+
+class ActiveUserTracker:
+    """
+    Buffers active user ids in memory and flushes them into the day's
+    HyperLogLog periodically, so tracking adds no Redis call per update.
+    """
+
+    def __init__(self, redis, flush_interval: float = ACTIVE_USERS_FLUSH_INTERVAL):
+        self.redis = redis
+        self.flush_interval = flush_interval
+        self._pending: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, user_id: int) -> None:
+        self._pending.add(user_id)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, set()
+        key = dau_key()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.pfadd(key, *pending)
+            pipe.expire(key, DAU_KEY_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("Failed to flush %d active users: %s", len(pending), e)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+async def read_statistics() -> Optional[Dict[str, int]]:
+    """
+    Return the current counters, served from an in-process snapshot for a
+    few seconds. None means the counters are unavailable (Redis down or
+    never reconciled) and the caller should fall back to counting.
+    """
+    snapshot = _snapshot_cache.get("stats")
+    if snapshot is not None:
+        return snapshot
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.mget([counter_key(name) for name in COUNTERS])
+        pipe.pfcount(dau_key())
+        values, dau = await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to read statistics counters: %s", e)
+        return None
+    if any(value is None for value in values):
+        return None
+    snapshot = {name: max(int(value), 0) for name, value in zip(COUNTERS, values)}
+    snapshot["daily_active_users"] = int(dau)
+    _snapshot_cache.set("stats", snapshot)
+    return snapshot
+
+
+async def reconcile_counters(session, redis) -> Dict[str, int]:
+    """
+    Recount every counter from the database and store the results. Each
+    counter is replaced only if it is unchanged since just before counting;
+    one that moved meanwhile may or may not already include the concurrent
+    write, so it is left for the next run rather than double-counted.
+    premium_active is not maintained incrementally (subscriptions expire
+    without a write), so this recount is what keeps it current.
+    """
+    keys = [counter_key(name) for name in COUNTERS]
+    before = await redis.mget(keys)
+
+    async def count(model) -> int:
+        return (await session.execute(select(func.count()).select_from(model))).scalar_one()
+
+    premium = await session.execute(
+        text("SELECT count(*) FROM subscriptions WHERE status = 'active' AND expires_at > now()")
+    )
+    counts = {
+        "routes": await count(Route),
+        "users": await count(User),
+        "premium_active": premium.scalar_one(),
+        "quiz_completions": await count(UserQuizResult),
+        "badges_awarded": await count(UserBadge),
+    }
+    expected = [previous.decode() if isinstance(previous, bytes) else (previous or "") for previous in before]
+    set_if_unchanged = redis.register_script(LUA_SET_IF_UNCHANGED)
+    skipped = await set_if_unchanged(keys=keys, args=expected + [counts[name] for name in COUNTERS])
+    _snapshot_cache.clear()
+    if skipped:
+        logger.info(
+            "Statistics counters changed during reconciliation, left for the next run: %s",
+            ", ".join(COUNTERS[int(index) - 1] for index in skipped),
+        )
+    logger.info("Statistics counters reconciled: %s", counts)
+    return counts
@@ -0,0 +1,68 @@
+import hashlib
+import multiprocessing
+import os
+
+import pytest
+
+import qrbatch
+
+SPECS = [
+    {"name": "route-1", "data": "https://t.me/example_bot?start=route_1"},
+    {"name": "route-2", "data": "https://t.me/example_bot?start=route_2"},
+]
+
+
+def _run_batch(root, results):
+    try:
+        report = qrbatch.generate_batch(SPECS, store=qrbatch.LocalObjectStore(root), workers=2)
+        results.put(("ok", report))
+    except BaseException as e:
+        results.put(("error", repr(e)))
+
+
+def _read(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def test_generate_batch_runs_inside_a_daemonic_process(tmp_path):
+    pytest.importorskip("qrcode")
+    # Celery prefork children are daemonic; multiprocessing refuses to let
+    # them start a ProcessPoolExecutor.
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_run_batch, args=(str(tmp_path), results), daemon=True)
+    child.start()
+    status, report = results.get(timeout=60)
+    child.join(timeout=10)
+
+    assert status == "ok", report
+    assert report["rendered"] == len(SPECS)
+    assert report["failed"] == 0
+
+
+def test_generate_batch_output_is_content_addressed_and_stable(tmp_path):
+    pytest.importorskip("qrcode")
+    first = qrbatch.LocalObjectStore(str(tmp_path / "first"))
+    second = qrbatch.LocalObjectStore(str(tmp_path / "second"))
+
+    report = qrbatch.generate_batch(SPECS, store=first, workers=2)
+    assert report["rendered"] == len(SPECS)
+    assert report["changed"] == len(SPECS)
+    manifest = first.load_manifest()
+    for spec in SPECS:
+        key = qrbatch.spec_key(spec["data"], qrbatch.DEFAULT_OPTIONS)
+        assert manifest[spec["name"]] == {"key": key, "path": os.path.relpath(first.object_path(key), first.root)}
+        assert first.exists(key)
+
+    # A second run over the same store renders nothing and rewrites an identical manifest.
+    manifest_bytes = _read(os.path.join(first.root, qrbatch.MANIFEST_NAME))
+    report = qrbatch.generate_batch(SPECS, store=first, workers=2)
+    assert (report["rendered"], report["changed"], report["removed"]) == (0, 0, 0)
+    assert _read(os.path.join(first.root, qrbatch.MANIFEST_NAME)) == manifest_bytes
+
+    # A fresh store yields the same keys, manifest and image bytes.
+    qrbatch.generate_batch(SPECS, store=second, workers=2)
+    assert _read(os.path.join(second.root, qrbatch.MANIFEST_NAME)) == manifest_bytes
+    for entry in manifest.values():
+        digest = [hashlib.sha256(_read(os.path.join(store.root, entry["path"]))).hexdigest() for store in (first, second)]
+        assert digest[0] == digest[1]
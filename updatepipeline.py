@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_WORKERS = 8
+DEFAULT_DRAIN_TIMEOUT = 10.0
+
+
+def update_chat_id(update: Update) -> Optional[int]:
+    """Chat an update belongs to, falling back to its sender (same rule as updatestreams.extract_chat_id)."""
+    try:
+        event = update.event
+    except Exception:
+        return None
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    sender = getattr(event, "from_user", None) or getattr(event, "user", None)
+    return sender.id if sender is not None else None
+
+
+class UpdatePipeline:
+    """
+    Bounded in-process queue between the webhook endpoint and the Dispatcher.
+
+    The webhook handler only enqueues and returns, so Telegram gets its 200
+    immediately. Each worker owns one queue and updates are routed by
+    `chat_id % workers`, so updates from one chat are handled one at a time
+    and in order (FSM state is never raced) while different chats run in
+    parallel. `queue_size` is split evenly between the worker queues.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        workers: int = DEFAULT_WORKERS,
+    ):
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+        self.bot = bot
+        self.dp = dp
+        self.workers = workers
+        self.queues: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)
+        ]
+        self._tasks: List[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def submit(self, update: Update) -> bool:
+        queue = self.queues[(update_chat_id(update) or 0) % self.workers]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning("Update queue is full, rejecting update %s", update.update_id)
+            return False
+        self.accepted += 1
+        return True
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"update-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info("Update pipeline started with %d workers", self.workers)
+
+    async def stop(self, timeout: Optional[float] = DEFAULT_DRAIN_TIMEOUT) -> None:
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self.queues)), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Update pipeline drain timed out, %d updates left in queue", self.queued()
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Update pipeline stopped")
+
+    def queued(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    async def _worker(self, index: int) -> None:
+        queue = self.queues[index]
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Worker %d failed to process update %s", index, update.update_id)
+            finally:
+                queue.task_done()
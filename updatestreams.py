@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = "updates"
+CONSUMER_GROUP = "dispatchers"
+DEFAULT_SHARDS = 16
+DEFAULT_STREAM_MAXLEN = 100000
+DEFAULT_READ_COUNT = 50
+DEFAULT_BLOCK_MS = 5000
+DEFAULT_CLAIM_IDLE_MS = 60000
+DEFAULT_MAX_DELIVERIES = 5
+PUBLISH_RETRY_MIN = 0.5  # seconds
+PUBLISH_RETRY_MAX = 30.0
+
+
+def extract_chat_id(data: Dict[str, Any]) -> Optional[int]:
+    for key, event in data.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        sender = event.get("from") or event.get("user")
+        if sender and "id" in sender:
+            return int(sender["id"])
+    return None
+
+
+def shard_for(chat_id: Optional[int], shards: int) -> int:
+    # Integer modulo is stable across processes, unlike hash() on strings.
+    return (chat_id or 0) % shards
+
+
+def stream_key(shard: int, prefix: str = STREAM_PREFIX) -> str:
+    return f"{prefix}:{shard}"
+
+
+def dead_letter_key(prefix: str = STREAM_PREFIX) -> str:
+    return f"{prefix}:dead"
+
+
+def shards_for_worker(index: int, count: int, shards: int) -> List[int]:
+    if count <= 0 or not 0 <= index < count:
+        raise ValueError(f"Invalid worker index {index} for {count} workers")
+    return [shard for shard in range(shards) if shard % count == index]
+
+
+class UpdateStreamPublisher:
+    def __init__(
+        self,
+        redis,
+        shards: int = DEFAULT_SHARDS,
+        maxlen: int = DEFAULT_STREAM_MAXLEN,
+        prefix: str = STREAM_PREFIX,
+    ):
+        self.redis = redis
+        self.shards = shards
+        self.maxlen = maxlen
+        self.prefix = prefix
+
+    async def publish(self, data: Dict[str, Any]) -> str:
+        shard = shard_for(extract_chat_id(data), self.shards)
+        payload = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        return await self.redis.xadd(
+            stream_key(shard, self.prefix),
+            {"update": payload},
+            maxlen=self.maxlen,
+            approximate=True,
+        )
+
+    async def publish_update(self, update: Update) -> str:
+        # by_alias keeps Telegram's field names ("from", not "from_user"), so
+        # polled updates shard exactly like the raw JSON the webhook publishes.
+        return await self.publish(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+
+    async def _publish_until_stored(self, update: Update) -> None:
+        delay = PUBLISH_RETRY_MIN
+        while True:
+            try:
+                await self.publish_update(update)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Publishing update %s failed, retrying in %.1fs: %s", update.update_id, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, PUBLISH_RETRY_MAX)
+
+    async def run_polling(
+        self,
+        bot: Bot,
+        allowed_updates: Optional[List[str]] = None,
+        polling_timeout: int = 30,
+    ) -> None:
+        offset = None
+        logger.info("Publishing polled updates to %d stream shards", self.shards)
+        while True:
+            try:
+                updates = await bot(
+                    GetUpdates(offset=offset, timeout=polling_timeout, allowed_updates=allowed_updates)
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Polling for updates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self._publish_until_stored(update)
+                # Only advance past an update once it is durably in the stream.
+                offset = update.update_id + 1
+
+
+class UpdateStreamWorker:
+    def __init__(
+        self,
+        redis,
+        bot: Bot,
+        dp: Dispatcher,
+        shards: Iterable[int],
+        consumer: str,
+        prefix: str = STREAM_PREFIX,
+        group: str = CONSUMER_GROUP,
+        count: int = DEFAULT_READ_COUNT,
+        block_ms: int = DEFAULT_BLOCK_MS,
+        claim_idle_ms: int = DEFAULT_CLAIM_IDLE_MS,
+        max_deliveries: int = DEFAULT_MAX_DELIVERIES,
+    ):
+        self.redis = redis
+        self.bot = bot
+        self.dp = dp
+        self.shards = list(shards)
+        self.consumer = consumer
+        self.prefix = prefix
+        self.group = group
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+
+    async def ensure_groups(self) -> None:
+        for shard in self.shards:
+            try:
+                await self.redis.xgroup_create(
+                    stream_key(shard, self.prefix), self.group, id="0", mkstream=True
+                )
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def run(self) -> None:
+        await self.ensure_groups()
+        logger.info("Stream worker %s consuming shards %s", self.consumer, self.shards)
+        await asyncio.gather(*(self._consume(shard) for shard in self.shards))
+
+    async def _consume(self, shard: int) -> None:
+        key = stream_key(shard, self.prefix)
+        # Re-read our own pending entries first so a restarted worker resumes where it died.
+        last_id = "0-0"
+        while True:
+            try:
+                if last_id == ">":
+                    await self._reclaim(key)
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {key: last_id}, count=self.count, block=self.block_ms
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Reading stream %s failed: %s", key, e)
+                await asyncio.sleep(1)
+                continue
+            entries = response[0][1] if response else []
+            if last_id != ">":
+                # Walk our own pending backlog once; entries that fail again stay
+                # pending and are retried by _reclaim after claim_idle_ms.
+                if not entries:
+                    last_id = ">"
+                    continue
+                last_id = entries[-1][0]
+            for entry_id, fields in entries:
+                if not fields:
+                    # Trimmed from the stream while pending; nothing left to process.
+                    await self.redis.xack(key, self.group, entry_id)
+                    continue
+                await self._handle(key, entry_id, fields)
+
+    async def _reclaim(self, key: str) -> None:
+        # Entries left pending by a dead consumer become ours after claim_idle_ms.
+        result = await self.redis.xautoclaim(
+            key, self.group, self.consumer, min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.count
+        )
+        for entry_id, fields in result[1]:
+            if fields:
+                await self._handle(key, entry_id, fields)
+
+    async def _handle(self, key: str, entry_id: str, fields: Dict[str, str]) -> None:
+        try:
+            data = json.loads(fields["update"])
+            update = Update.model_validate(data, context={"bot": self.bot})
+            await self.dp.feed_update(self.bot, update)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to process update %s from %s", entry_id, key)
+            # Unacked entries stay pending and are redelivered by _reclaim
+            # once idle, until they are moved to the dead-letter stream.
+            try:
+                if not await self._dead_letter(key, entry_id, fields):
+                    return
+            except Exception as e:
+                logger.error("Could not check deliveries of update %s from %s: %s", entry_id, key, e)
+                return
+        await self.redis.xack(key, self.group, entry_id)
+
+    async def _dead_letter(self, key: str, entry_id: str, fields: Dict[str, str]) -> bool:
+        pending = await self.redis.xpending_range(key, self.group, min=entry_id, max=entry_id, count=1)
+        deliveries = pending[0]["times_delivered"] if pending else self.max_deliveries
+        if deliveries < self.max_deliveries:
+            return False
+        await self.redis.xadd(
+            dead_letter_key(self.prefix),
+            {**fields, "source": key, "entry_id": entry_id, "deliveries": deliveries},
+            maxlen=DEFAULT_STREAM_MAXLEN,
+            approximate=True,
+        )
+        logger.error("Moved update %s from %s to the dead-letter stream after %d deliveries",
+                     entry_id, key, deliveries)
+        return True
@@ -0,0 +1,230 @@
+import asyncio
+import datetime
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = "en"
+CONTEXT_CACHE_TTL = 300  # seconds
+MISSING_USER_CACHE_TTL = 60  # seconds an unknown telegram id is remembered as unknown
+MISSING_USER = {"missing": True}
+LANGUAGE_CACHE_TTL = 86400  # seconds, same as languageswitcherhandler
+MAX_BATCH_SIZE = 500
+PREMIUM_FLAGS = frozenset({"premium_routes", "audio_guides", "offline_access", "ad_free"})
+
+USER_CONTEXT_SQL = """
+SELECT u.id, u.telegram_id, u.language_code, u.role,
+       s.status AS subscription_status, s.expires_at AS subscription_expires_at
+FROM users u
+LEFT JOIN LATERAL (
+    SELECT status, expires_at
+    FROM subscriptions
+    WHERE user_id = u.id AND status = 'active' AND expires_at > now()
+    ORDER BY expires_at DESC
+    LIMIT 1
+) s ON true
+WHERE u.telegram_id = ANY($1::bigint[])
+"""
+
+
+@dataclass(frozen=True)
+class UserContext:
+    telegram_id: int
+    user_id: Optional[int] = None
+    language: str = DEFAULT_LANGUAGE
+    is_premium: bool = False
+    premium_until: Optional[datetime.datetime] = None
+    role: str = "user"
+    flags: FrozenSet[str] = field(default_factory=frozenset)
+
+    def has_flag(self, name: str) -> bool:
+        return name in self.flags
+
+
+def context_key(telegram_id: int) -> str:
+    return f"user:{telegram_id}:ctx"
+
+
+def language_key(telegram_id: int) -> str:
+    return f"user:{telegram_id}:lang"
+
+
+async def invalidate_user_context(telegram_id: int, redis=None) -> None:
+    """
+    Drop the cached context after a write that changes it (registration,
+    role, subscription), so the next update reloads it from the database.
+    """
+    if redis is None:
+        from core.redis import redis_client as redis
+    try:
+        await redis.delete(context_key(telegram_id))
+    except Exception as e:
+        logger.warning("Failed to invalidate cached context for user %s: %s", telegram_id, e)
+
+
+class _BatchLoader:
+    """
+    Coalesces lookups issued during the same event-loop tick into one
+    `fetch(keys)` call, so concurrent updates share a single SQL round-trip.
+    """
+
+    def __init__(self, fetch: Callable[[List[int]], Awaitable[Dict[int, Any]]], max_batch: int = MAX_BATCH_SIZE):
+        self.fetch = fetch
+        self.max_batch = max_batch
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._scheduled = False
+
+    def load(self, key: int) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(key)
+        if future is None:
+            future = loop.create_future()
+            self._pending[key] = future
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    async def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._scheduled = False
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch):
+            chunk = keys[start:start + self.max_batch]
+            try:
+                rows = await self.fetch(chunk)
+            except Exception as e:
+                for key in chunk:
+                    if not pending[key].done():
+                        pending[key].set_exception(e)
+                continue
+            for key in chunk:
+                if not pending[key].done():
+                    pending[key].set_result(rows.get(key))
+
+
+class UserContextLoaderMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that resolves a compact UserContext once per
+    update and exposes it to handlers as `user_context`.
+
+    Reads use a single MGET of the cached context and language keys; misses
+    are resolved with one batched SQL query and written back to Redis.
+    Unknown users are cached as missing for MISSING_USER_CACHE_TTL seconds.
+    Writers call invalidate_user_context after changing a user's row or
+    subscription.
+    """
+
+    def __init__(self, redis, db_pool, features: Optional[Iterable[str]] = None,
+                 context_ttl: int = CONTEXT_CACHE_TTL, activity_tracker=None):
+        self.redis = redis
+        self.db_pool = db_pool
+        self.activity_tracker = activity_tracker
+        self.features = frozenset(features or ())
+        self.context_ttl = context_ttl
+        self._loader = _BatchLoader(self._fetch_rows)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user: Optional[TelegramUser] = data.get("event_from_user")
+        if tg_user is not None:
+            if self.activity_tracker is not None:
+                self.activity_tracker.track(tg_user.id)
+            try:
+                data["user_context"] = await self.resolve(tg_user)
+            except Exception:
+                logger.exception("Failed to resolve user context for %s", tg_user.id)
+                data["user_context"] = self._build(tg_user.id, None, None, tg_user.language_code)
+        return await handler(event, data)
+
+    async def resolve(self, tg_user: TelegramUser) -> UserContext:
+        telegram_id = tg_user.id
+        cached_ctx, cached_lang = None, None
+        try:
+            cached_ctx, cached_lang = await self.redis.mget(context_key(telegram_id), language_key(telegram_id))
+        except Exception as e:
+            logger.warning("Redis MGET error for user %s: %s", telegram_id, e)
+        if cached_ctx:
+            try:
+                cached = json.loads(cached_ctx)
+                if cached.get("missing"):
+                    return self._build(telegram_id, None, cached_lang, tg_user.language_code)
+                return self._build(telegram_id, cached, cached_lang, tg_user.language_code)
+            except (AttributeError, TypeError, ValueError):
+                logger.warning("Discarding malformed cached context for user %s", telegram_id)
+        row = await self._loader.load(telegram_id)
+        if row is None:
+            # Remember unknown users briefly so their updates do not all hit the database.
+            await self._store(telegram_id, MISSING_USER, None, ttl=MISSING_USER_CACHE_TTL)
+            return self._build(telegram_id, None, cached_lang, tg_user.language_code)
+        cached = self._row_to_cache(row)
+        await self._store(telegram_id, cached, None if cached_lang else row["language_code"])
+        return self._build(telegram_id, cached, cached_lang or row["language_code"], tg_user.language_code)
+
+    async def _fetch_rows(self, telegram_ids: List[int]) -> Dict[int, Any]:
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(USER_CONTEXT_SQL, telegram_ids)
+        return {row["telegram_id"]: row for row in rows}
+
+    @staticmethod
+    def _row_to_cache(row) -> Dict[str, Any]:
+        expires_at = row["subscription_expires_at"]
+        active = (
+            row["subscription_status"] == "active"
+            and expires_at is not None
+            and expires_at > datetime.datetime.now(expires_at.tzinfo)
+        )
+        return {
+            "id": row["id"],
+            "role": row["role"] or "user",
+            "premium_until": expires_at.isoformat() if active else None,
+        }
+
+    async def _store(self, telegram_id: int, cached: Dict[str, Any], language: Optional[str],
+                     ttl: Optional[int] = None) -> None:
+        ttl = ttl or self.context_ttl
+        if cached.get("premium_until"):
+            until = datetime.datetime.fromisoformat(cached["premium_until"])
+            remaining = int((until - datetime.datetime.now(until.tzinfo)).total_seconds())
+            ttl = max(1, min(ttl, remaining))
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(context_key(telegram_id), json.dumps(cached, separators=(",", ":")), ex=ttl)
+            if language:
+                pipe.set(language_key(telegram_id), language, ex=LANGUAGE_CACHE_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("Redis set error for user context %s: %s", telegram_id, e)
+
+    def _build(self, telegram_id: int, cached: Optional[Dict[str, Any]], language: Optional[str],
+               fallback_language: Optional[str]) -> UserContext:
+        cached = cached or {}
+        premium_until = None
+        if cached.get("premium_until"):
+            premium_until = datetime.datetime.fromisoformat(cached["premium_until"])
+            if premium_until <= datetime.datetime.now(premium_until.tzinfo):
+                premium_until = None
+        is_premium = premium_until is not None
+        if isinstance(language, bytes):
+            language = language.decode("utf-8")
+        if not language and fallback_language:
+            language = fallback_language.split("-", 1)[0].lower()
+        return UserContext(
+            telegram_id=telegram_id,
+            user_id=cached.get("id"),
+            language=language or DEFAULT_LANGUAGE,
+            is_premium=is_premium,
+            premium_until=premium_until,
+            role=cached.get("role", "user"),
+            flags=self.features | PREMIUM_FLAGS if is_premium else self.features,
+        )